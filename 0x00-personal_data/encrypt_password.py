@@ -1,14 +1,188 @@
 #!/usr/bin/env python3
 """Module for hashing passwords and validating them"""
+import asyncio
+import os
+import threading
+import time
 import bcrypt
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+DEFAULT_ROUNDS = 12
+
+
+def rounds_file() -> str:
+    """Returns the path of the file holding the calibrated cost factor
+
+    BCRYPT_ROUNDS_FILE, ~/.bcrypt_rounds by default; the user
+    authentication service reads the same file.
+    """
+    return os.getenv("BCRYPT_ROUNDS_FILE",
+                     os.path.expanduser("~/.bcrypt_rounds"))
+
+
+def get_rounds() -> int:
+    """Returns the configured bcrypt cost factor
+
+    BCRYPT_ROUNDS if set, else the cost saved by calibrate_rounds,
+    else DEFAULT_ROUNDS.
+    """
+    rounds = os.getenv("BCRYPT_ROUNDS")
+    if rounds is not None:
+        return int(rounds)
+    try:
+        with open(rounds_file()) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return DEFAULT_ROUNDS
+
+
+def save_rounds(rounds: int):
+    """Atomically writes a cost factor to rounds_file()"""
+    path = rounds_file()
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            f.write("{}\n".format(rounds))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
 def hash_password(password: str) -> bytes:
     """Hashes a password with a salt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(get_rounds())
     return bcrypt.hashpw(password.encode(), salt)
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """Validates that the provided password matches the hashed password"""
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """Reads the cost factor out of a $2b$NN$... bcrypt hash"""
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Tells if a hash was made with another cost than the configured one"""
+    return hash_rounds(hashed_password) != get_rounds()
+
+
+def verify_and_rehash(hashed_password: bytes,
+                      password: str) -> Tuple[bool, Optional[bytes]]:
+    """Validates a password and re-hashes it if its cost is stale
+
+    Return:
+      - (valid, new_hash) where new_hash is None unless the caller
+        should store it in place of hashed_password.
+    """
+    if not is_valid(hashed_password, password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, hash_password(password)
+    return True, None
+
+
+def calibrate_rounds(target: float = 0.25, minimum: int = 4,
+                     maximum: int = 16) -> int:
+    """Picks the highest cost factor hashing within target seconds
+
+    The result is saved to rounds_file(), where every process of both
+    services picks it up, unless they set BCRYPT_ROUNDS explicitly.
+    """
+    rounds = minimum
+    for cost in range(minimum, maximum + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+        if time.perf_counter() - start > target:
+            break
+        rounds = cost
+    save_rounds(rounds)
+    return rounds
+
+
+class PasswordHasher:
+    """Runs bcrypt on a pool of worker threads.
+
+    bcrypt releases the GIL, so workers hash in parallel and callers
+    (request threads, event loops) are not stalled.
+    """
+
+    def __init__(self, workers: int = None):
+        """Starts a pool of worker threads (one per CPU by default)"""
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix="bcrypt")
+
+    def submit_hash(self, password: str) -> Future:
+        """Hashes a password on the pool"""
+        return self.executor.submit(hash_password, password)
+
+    def submit_is_valid(self, hashed_password: bytes,
+                        password: str) -> Future:
+        """Validates a password on the pool"""
+        return self.executor.submit(is_valid, hashed_password, password)
+
+    def hash_password(self, password: str) -> bytes:
+        """Hashes a password on the pool and waits for the result"""
+        return self.submit_hash(password).result()
+
+    def is_valid(self, hashed_password: bytes, password: str) -> bool:
+        """Validates a password on the pool and waits for the result"""
+        return self.submit_is_valid(hashed_password, password).result()
+
+    def hash_many(self, passwords: Iterable[str]) -> List[bytes]:
+        """Hashes passwords in parallel, keeping their order"""
+        return list(self.executor.map(hash_password, passwords))
+
+    async def hash_password_async(self, password: str) -> bytes:
+        """Hashes a password without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, hash_password, password)
+
+    async def is_valid_async(self, hashed_password: bytes,
+                             password: str) -> bool:
+        """Validates a password without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, is_valid, hashed_password, password)
+
+    def shutdown(self, wait: bool = True):
+        """Stops the workers"""
+        self.executor.shutdown(wait)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher() -> PasswordHasher:
+    """Returns the shared hasher, sized by HASH_WORKERS if set"""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher(int(os.getenv("HASH_WORKERS", "0")))
+        return _hasher
+
+
+def hash_many(passwords: Iterable[str]) -> List[bytes]:
+    """Hashes passwords in parallel on the shared hasher"""
+    return get_hasher().hash_many(passwords)
+
+
+async def hash_password_async(password: str) -> bytes:
+    """Hashes a password on the shared hasher"""
+    return await get_hasher().hash_password_async(password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """Validates a password on the shared hasher"""
+    return await get_hasher().is_valid_async(hashed_password, password)
+
+
+if __name__ == "__main__":
+    print(calibrate_rounds())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Stand-in for mysql.connector, backed by an in-memory sqlite3 database.
+
+Lets ConnectionPool and main() run without a MySQL server:
+
+    pool = ConnectionPool(FakeConnector(rows, connect_latency=0.05))
+    main(pool)
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+COLUMNS = ("name", "email", "phone", "ssn", "password", "ip", "last_login",
+           "user_agent")
+
+
+class FakeConnection:
+    """The part of MySQLConnection that filtered_logger uses."""
+
+    def __init__(self, connection: sqlite3.Connection):
+        """Wraps an open sqlite3 connection."""
+        self._connection = connection
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        """Checks that the connection was not closed or dropped."""
+        return not self.closed
+
+    def cursor(self) -> sqlite3.Cursor:
+        """Returns a cursor with execute, fetchmany and close."""
+        if self.closed:
+            raise sqlite3.ProgrammingError("connection closed")
+        return self._connection.cursor()
+
+    def drop(self):
+        """Simulates the server closing the connection."""
+        self.closed = True
+
+    def close(self):
+        """Closes the connection."""
+        self.closed = True
+        self._connection.close()
+
+
+class FakeConnector:
+    """Connection factory with the same interface as get_db.
+
+    Every connection reads the same users table, filled with rows. Each
+    connect waits connect_latency seconds, like the network and login
+    handshake of a real server, and is counted in connects.
+    """
+
+    def __init__(self, rows: Iterable[tuple] = (),
+                 connect_latency: float = 0.0):
+        """Creates the shared database and its users table."""
+        self.uri = "file:fake_connector_{}?mode=memory&cache=shared".format(
+            id(self))
+        # The shared in-memory database lives as long as one connection
+        self._keeper = sqlite3.connect(self.uri, uri=True)
+        self._keeper.execute("CREATE TABLE users ({})".format(
+            ", ".join(COLUMNS)))
+        self._keeper.executemany(
+            "INSERT INTO users VALUES ({})".format(
+                ", ".join("?" * len(COLUMNS))), rows)
+        self._keeper.commit()
+        self.connect_latency = connect_latency
+        self.connects = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> FakeConnection:
+        """Opens a new connection."""
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.connects += 1
+        return FakeConnection(sqlite3.connect(
+            self.uri, uri=True, check_same_thread=False))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Module for scrubbing PII out of archived log files in bulk"""
+
+import argparse
+import mmap
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+from typing import BinaryIO, Iterator, List, Pattern, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redactor
+
+CHUNK_SIZE = 4 * 1024 * 1024
+ENCODING = "utf-8"
+
+_redactor = None
+
+
+def _init_worker(fields: Tuple[str, ...], redaction: str, separator: str):
+    """Builds the redactor once per worker process."""
+    global _redactor
+    _redactor = get_redactor(fields, redaction, separator)
+
+
+def split_ending(line: bytes) -> Tuple[bytes, bytes]:
+    """Splits a raw line into its text and its LF or CRLF ending.
+
+    The ending is kept out of redaction, so a value at the end of a
+    line never swallows the newline.
+    """
+    if line.endswith(b"\r\n"):
+        return line[:-2], line[-2:]
+    if line.endswith(b"\n"):
+        return line[:-1], line[-1:]
+    return line, b""
+
+
+def redact_chunk(lines: List[bytes]) -> Tuple[bytes, int]:
+    """Redacts a chunk of raw lines, one line at a time.
+
+    Each line is redacted on its own so the result does not depend on
+    where the input was split.
+    """
+    out = []
+    for line in lines:
+        body, ending = split_ending(line)
+        txt = body.decode(ENCODING, "surrogateescape")
+        out.append(_redactor(txt).encode(ENCODING, "surrogateescape"))
+        out.append(ending)
+    return b"".join(out), len(lines)
+
+
+def read_chunks(f: BinaryIO, chunk_size: int = CHUNK_SIZE
+                ) -> Iterator[List[bytes]]:
+    """Yields line-aligned chunks of roughly chunk_size bytes."""
+    while True:
+        lines = f.readlines(chunk_size)
+        if not lines:
+            return
+        yield lines
+
+
+def redact_file(src: BinaryIO, dst: BinaryIO, fields: Tuple[str, ...],
+                redaction: str = RedactingFormatter.REDACTION,
+                separator: str = RedactingFormatter.SEPARATOR,
+                workers: int = 1, chunk_size: int = CHUNK_SIZE
+                ) -> Tuple[int, int]:
+    """Redacts src into dst, keeping the original line order.
+
+    With workers > 1 chunks are redacted in a multiprocessing pool;
+    with workers == 1 they are redacted in-process. Both paths produce
+    the same bytes.
+    Return:
+      - A (lines, bytes) tuple of what was written.
+    """
+    n_lines, n_bytes = 0, 0
+    initargs = (tuple(fields), redaction, separator)
+    chunks = read_chunks(src, chunk_size)
+    if workers <= 1:
+        _init_worker(*initargs)
+        results = map(redact_chunk, chunks)
+        for data, count in results:
+            dst.write(data)
+            n_lines, n_bytes = n_lines + count, n_bytes + len(data)
+        return n_lines, n_bytes
+    with Pool(workers, _init_worker, initargs) as pool:
+        for data, count in pool.imap(redact_chunk, chunks):
+            dst.write(data)
+            n_lines, n_bytes = n_lines + count, n_bytes + len(data)
+    return n_lines, n_bytes
+
+
+def bytes_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """Compiles the extract pattern of filter_datum as a bytes regex.
+
+    Values also stop at a line ending (LF or CRLF, as in split_ending),
+    so a whole file can be scanned at once with the same result as
+    redacting it line by line.
+    """
+    value = r'[^{0}\r\n]*(?:\r(?!\n)[^{0}\r\n]*)*'.format(separator)
+    extract = r'(?P<field>{})={}'.format('|'.join(fields), value)
+    return re.compile(extract.encode(ENCODING))
+
+
+def redact_mmap(src_path: str, dst: BinaryIO, fields: Tuple[str, ...],
+                redaction: str = RedactingFormatter.REDACTION,
+                separator: str = RedactingFormatter.SEPARATOR
+                ) -> Tuple[int, int]:
+    """Redacts a file on disk without decoding it to str.
+
+    The file is memory-mapped and the untouched spans between matches
+    are written straight from the mapping through memoryview slices.
+    Return:
+      - A (lines, bytes) tuple of what was written.
+    """
+    pattern = bytes_pattern(tuple(fields), separator)
+    mask = b'=' + redaction.encode(ENCODING)
+    n_bytes = 0
+    with open(src_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            pos = 0
+            for match in pattern.finditer(mm):
+                n_bytes += dst.write(view[pos:match.end('field')])
+                n_bytes += dst.write(mask)
+                pos = match.end()
+            n_bytes += dst.write(view[pos:])
+            n_lines = sum(mm[i:i + CHUNK_SIZE].count(b'\n')
+                          for i in range(0, len(mm), CHUNK_SIZE))
+    return n_lines, n_bytes
+
+
+def report(n_lines: int, n_bytes: int, elapsed: float, mode: str):
+    """Prints the throughput of a run on stderr."""
+    elapsed = max(elapsed, 1e-9)
+    print("{} lines, {:.1f} MB in {:.2f}s: {:.0f} lines/s, {:.1f} MB/s "
+          "({})".format(n_lines, n_bytes / 1e6, elapsed, n_lines / elapsed,
+                        n_bytes / 1e6 / elapsed, mode), file=sys.stderr)
+
+
+def main(argv: List[str] = None):
+    """Redacts a log file from the command line and reports throughput."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="log file to scrub ('-' for stdin)")
+    parser.add_argument("output", help="destination ('-' for stdout)")
+    parser.add_argument("--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to redact")
+    parser.add_argument("--redaction", default=RedactingFormatter.REDACTION)
+    parser.add_argument("--separator", default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--mmap", action="store_true",
+                        help="redact the memory-mapped bytes of input "
+                             "in-process, without decoding")
+    args = parser.parse_args(argv)
+    if args.mmap and args.input == "-":
+        parser.error("--mmap needs an input file, stdin can't be mapped")
+    fields = tuple(args.fields.split(","))
+
+    dst = sys.stdout.buffer if args.output == "-" else \
+        open(args.output, "wb", buffering=CHUNK_SIZE)
+    start = time.perf_counter()
+    if args.mmap:
+        with dst:
+            n_lines, n_bytes = redact_mmap(
+                args.input, dst, fields, args.redaction, args.separator)
+        mode = "mmap"
+    else:
+        src = sys.stdin.buffer if args.input == "-" else \
+            open(args.input, "rb")
+        with src, dst:
+            n_lines, n_bytes = redact_file(
+                src, dst, fields, args.redaction, args.separator,
+                args.workers, args.chunk_size)
+        mode = "{} workers".format(args.workers)
+    report(n_lines, n_bytes, time.perf_counter() - start, mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""ConnectionPool over the fake connector: reuse, latency, exhaustion."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("mysql.connector")
+
+from fake_connector import FakeConnector  # noqa: E402
+from filtered_logger import ConnectionPool, main  # noqa: E402
+
+LATENCY = 0.05
+ROW = ("bob", "bob@dylan.com", "(555) 01", "111-22-3333", "pwd",
+       "10.0.0.1", "2019-11-14 06:14:24", "Mozilla/5.0")
+
+
+def test_released_connections_are_reused():
+    """Only the first acquire pays the connect latency."""
+    connector = FakeConnector(connect_latency=LATENCY)
+    pool = ConnectionPool(connector, size=2)
+    start = time.monotonic()
+    with pool.connection():
+        pass
+    first = time.monotonic() - start
+    start = time.monotonic()
+    for _ in range(100):
+        with pool.connection() as connection:
+            assert connection.is_connected()
+    reused = (time.monotonic() - start) / 100
+    assert connector.connects == 1
+    assert first >= LATENCY
+    assert reused < LATENCY / 10
+
+
+def test_exhausted_pool_times_out():
+    """acquire raises TimeoutError when every connection is in use."""
+    connector = FakeConnector()
+    pool = ConnectionPool(connector, size=2)
+    held = [pool.acquire(), pool.acquire()]
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+    assert connector.connects == 2
+    pool.release(held.pop())
+    assert pool.acquire(timeout=0.1).is_connected()
+
+
+def test_release_wakes_a_waiting_acquire():
+    """A blocked acquire gets the connection as soon as it is released."""
+    pool = ConnectionPool(FakeConnector(), size=1)
+    connection = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(
+        target=lambda: acquired.append(pool.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert acquired == []
+    pool.release(connection)
+    waiter.join(1)
+    assert acquired == [connection]
+
+
+def test_dropped_connection_is_replaced():
+    """The health check discards a connection the server dropped."""
+    connector = FakeConnector()
+    pool = ConnectionPool(connector, size=1)
+    with pool.connection() as connection:
+        connection.drop()
+    with pool.connection() as replacement:
+        assert replacement is not connection
+        assert replacement.is_connected()
+    assert connector.connects == 2
+
+
+def test_idle_connection_is_evicted():
+    """Connections idle for idle_timeout are closed, not handed out."""
+    connector = FakeConnector()
+    pool = ConnectionPool(connector, size=1, idle_timeout=0.05)
+    with pool.connection() as connection:
+        pass
+    time.sleep(0.1)
+    with pool.connection() as replacement:
+        assert replacement is not connection
+    assert connection.closed
+    assert connector.connects == 2
+
+
+def test_main_streams_rows_from_the_pool(capsys):
+    """main reads the users table through the pool, redacted."""
+    connector = FakeConnector([ROW] * 5)
+    pool = ConnectionPool(connector, size=1)
+    main(pool, batch_size=2)
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 5
+    assert "name=***; email=***" in lines[0]
+    assert "bob" not in lines[0] and "ip=10.0.0.1" in lines[0]
+    assert connector.connects == 1
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Equivalence and speed of TokenRedactor against filter_datum."""
+import os
+import random
+import sys
+import timeit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("mysql.connector")
+
+from filtered_logger import (  # noqa: E402
+    PII_FIELDS, Redactor, TokenRedactor, filter_datum)
+
+# Short names over few letters, so fields are often suffixes of keys
+NAMES = ("a", "b", "ab", "ba", "aab", "name", "email", "ip", "x_y")
+SEPARATORS = (";", "&", "|", ",", " ")
+
+
+def random_record(rng: random.Random, separator: str) -> str:
+    """Returns a well-formed record of key=value fields."""
+    tokens = []
+    for _ in range(rng.randrange(8)):
+        key = "".join(rng.choice(NAMES) for _ in range(rng.randrange(3)))
+        value = "".join(rng.choice("ab=: x")
+                        for _ in range(rng.randrange(6)))
+        tokens.append("{}={}".format(key, value))
+    record = separator.join(tokens)
+    if rng.random() < 0.3:
+        record = "[HOLBERTON] user_data INFO: " + record
+    if rng.random() < 0.5:
+        record += separator
+    return record
+
+
+def test_fuzz_same_output_as_filter_datum():
+    """Random fields, separators and records give identical output."""
+    rng = random.Random(0)
+    for _ in range(10000):
+        fields = rng.sample(NAMES, rng.randrange(len(NAMES)))
+        separator = rng.choice(SEPARATORS)
+        redaction = rng.choice(("***", "xxx", ""))
+        record = random_record(rng, separator)
+        token = TokenRedactor(tuple(fields), redaction, separator)
+        assert token(record) == \
+            filter_datum(fields, redaction, record, separator), \
+            (fields, separator, record)
+
+
+def test_fuzz_arbitrary_text():
+    """Text with '=' and separators anywhere gives identical output."""
+    rng = random.Random(1)
+    for _ in range(10000):
+        fields = rng.sample(NAMES, rng.randrange(len(NAMES)))
+        separator = rng.choice(SEPARATORS)
+        record = "".join(rng.choice("abn=x;&|, ")
+                         for _ in range(rng.randrange(20)))
+        token = TokenRedactor(tuple(fields), "***", separator)
+        assert token(record) == \
+            filter_datum(fields, "***", record, separator), \
+            (fields, separator, record)
+
+
+@pytest.mark.parametrize("fields", [15, 135])
+def test_faster_than_regex_on_long_records(fields):
+    """Microbenchmark on records with many fields, half of them PII."""
+    names = list(PII_FIELDS) + ["field{}".format(i) for i in range(fields)]
+    record = "; ".join("{}=value{}".format(name, i)
+                       for i, name in enumerate(names[:fields])) + ";"
+    regex = Redactor(PII_FIELDS, "***", ";")
+    token = TokenRedactor(PII_FIELDS, "***", ";")
+    assert token(record) == regex(record)
+    times = {}
+    for name, redactor in (("regex", regex), ("token", token)):
+        times[name] = min(timeit.repeat(lambda: redactor(record),
+                                        number=200, repeat=5))
+    print("{} fields: regex {:.1f}us, token {:.1f}us".format(
+        fields, times["regex"] / 200 * 1e6, times["token"] / 200 * 1e6))
+    assert times["token"] < times["regex"]
@@ -7,7 +7,7 @@ from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 
 from api.v1.views import app_views
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, PathMatcher
 from api.v1.auth.basic_auth import BasicAuth
 from api.v1.auth.session_auth import SessionAuth
 from api.v1.auth.session_exp_auth import SessionExpAuth
@@ -25,6 +25,12 @@ elif auth_type == 'session_auth':
     auth = SessionAuth()
 elif auth_type == 'session_exp_auth':
     auth = SessionExpAuth()
+EXCLUDED_PATHS = PathMatcher([
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/auth_session/login/',
+])
 
 
 @app.errorhandler(404)
@@ -45,23 +51,26 @@ def forbidden(error) -> str:
     return jsonify({"error": "Forbidden"}), 403
 
 
+@app.errorhandler(503)
+def service_unavailable(error) -> str:
+    """Handles 503 errors."""
+    return jsonify({"error": "Service Unavailable"}), 503
+
+
 @app.before_request
 def verify_user():
     """Verifies user authentication before processing a request.
     """
     if auth:
-        excluded_paths = [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/',
-            '/api/v1/auth_session/login/',
-        ]
-        if auth.require_auth(request.path, excluded_paths):
+        if auth.require_auth(request.path, EXCLUDED_PATHS):
             auth_header = auth.authorization_header(request)
             session_cookie = auth.session_cookie(request)
             if auth_header is None and session_cookie is None:
                 abort(401)
-            request.current_user = auth.current_user(request)
+            try:
+                request.current_user = auth.current_user(request)
+            except TimeoutError:
+                abort(503)  # Too many password checks pending
             if request.current_user is None:
                 abort(403)
 
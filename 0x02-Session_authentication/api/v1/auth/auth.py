@@ -6,6 +6,33 @@ import re
 import os
 
 
+class PathMatcher:
+    """Set of excluded paths compiled into one regex.
+    Each path is a prefix; a trailing '*' matches anything and a
+    trailing '/' is optional, like in Auth.require_auth.
+    """
+
+    def __init__(self, excluded_paths: List[str]) -> None:
+        """Compiles the excluded paths once."""
+        patterns = []
+        for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+            if exclusion_path[-1] == '*':
+                pattern = '{}.*'.format(exclusion_path[0:-1])
+            elif exclusion_path[-1] == '/':
+                pattern = '{}/*'.format(exclusion_path[0:-1])
+            else:
+                pattern = '{}/*'.format(exclusion_path)
+            patterns.append('(?:{})'.format(pattern))
+        self.regex = None
+        if len(patterns) > 0:
+            self.regex = re.compile('|'.join(patterns))
+
+    def match(self, path: str) -> bool:
+        """Checks if path is excluded."""
+        return self.regex is not None and \
+            self.regex.match(path) is not None
+
+
 class Auth:
     """Authentication class."""
 
@@ -13,21 +40,16 @@ class Auth:
         """Checks if a path requires authentication.
         Args:
           - path: The path to check.
-          - excluded_paths: A list of paths that do not require auth.
+          - excluded_paths: A list of paths that do not require auth,
+            or a PathMatcher built from it once.
         Return:
           - False: Authentication is not required.
         """
         if path is not None and excluded_paths is not None:
-            for exclusion_path in map(lambda x: x.strip(), excluded_paths):
-                pattern = ''
-                if exclusion_path[-1] == '*':
-                    pattern = '{}.*'.format(exclusion_path[0:-1])
-                elif exclusion_path[-1] == '/':
-                    pattern = '{}/*'.format(exclusion_path[0:-1])
-                else:
-                    pattern = '{}/*'.format(exclusion_path)
-                if re.match(pattern, path):
-                    return False
+            if not isinstance(excluded_paths, PathMatcher):
+                excluded_paths = PathMatcher(excluded_paths)
+            if excluded_paths.match(path):
+                return False
         return True
 
     def authorization_header(self, request=None) -> str:
@@ -3,14 +3,109 @@
 """
 from .auth import Auth
 import re
+import os
+import sys
+import time
 import base64
 import binascii
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Tuple, TypeVar
 from models.user import User
 
 
+class CredentialCache:
+    """Bounded LRU cache of verified Authorization headers.
+    Maps a keyed hash of the header (never the header itself, which
+    holds the password) to the user id, email and password hash it
+    was verified against. Entries expire after ttl seconds and are dropped
+    when their user is saved or removed.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300) -> None:
+        """Initializes an empty cache with a random hashing key."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.secret = os.urandom(32)
+        self.entries = OrderedDict()
+        self.keys_by_user_id = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        User.listen(self.user_changed)
+
+    def key(self, auth_header: str) -> bytes:
+        """Returns the keyed hash of a header."""
+        return hashlib.blake2b(auth_header.encode(), key=self.secret,
+                               digest_size=16).digest()
+
+    def get(self, auth_header: str) -> TypeVar('User'):
+        """Returns the cached user of a header or None."""
+        key = self.key(auth_header)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[3] < time.monotonic():
+                self.drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        user = User.get(entry[0])
+        # Also catches changes made by other processes
+        if user is None or (user.email, user.password) != entry[1:3]:
+            with self.lock:
+                self.drop(key)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return user
+
+    def put(self, auth_header: str, user: TypeVar('User')) -> None:
+        """Remembers that a header was verified for user."""
+        key = self.key(auth_header)
+        with self.lock:
+            self.drop(key)
+            self.entries[key] = (user.id, user.email, user.password,
+                                 time.monotonic() + self.ttl)
+            self.keys_by_user_id.setdefault(user.id, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self.drop(next(iter(self.entries)))
+
+    def drop(self, key: bytes) -> None:
+        """Removes one entry, the lock being held."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.keys_by_user_id.get(entry[0])
+        keys.discard(key)
+        if len(keys) == 0:
+            del self.keys_by_user_id[entry[0]]
+
+    def user_changed(self, user: TypeVar('User'), kind: str) -> None:
+        """Drops the entries of a saved or removed user."""
+        with self.lock:
+            for key in list(self.keys_by_user_id.get(user.id, ())):
+                self.drop(key)
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters and the size."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self.entries)}
+
+
 class BasicAuth(Auth):
     """Basic authentication class."""
+    # What base64.b64decode(validate=True) accepts: before Python 3.11
+    # a regex check, since then the strict mode of a2b_base64
+    BASE64 = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+    STRICT_BASE64 = sys.version_info >= (3, 11)
+    credential_cache = CredentialCache(
+        int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1024')),
+        float(os.getenv('BASIC_AUTH_CACHE_TTL', '300')))
 
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
@@ -66,6 +161,38 @@ class BasicAuth(Auth):
                 return user, password
         return None, None
 
+    def parse_authorization_header(
+           self,
+           authorization_header: str) -> Tuple[str, str]:
+        """Extracts user credentials from an Authorization header.
+        Does the work of extract_base64_authorization_header,
+        decode_base64_authorization_header and extract_user_credentials
+        in one pass, with the same result.
+        Args:
+          - authorization_header: The full authorization header string.
+        Return:
+          - A tuple (user, password) or (None, None) if extraction fails.
+        """
+        if type(authorization_header) != str:
+            return None, None
+        scheme, _, token = authorization_header.strip().partition(' ')
+        if scheme != 'Basic' or token == '' or not token.isascii():
+            return None, None
+        try:
+            if self.STRICT_BASE64:
+                raw = binascii.a2b_base64(token, strict_mode=True)
+            elif self.BASE64.fullmatch(token) is None:
+                return None, None
+            else:
+                raw = binascii.a2b_base64(token)
+            decoded = raw.decode('utf-8').strip()
+        except (binascii.Error, UnicodeDecodeError):
+            return None, None
+        user, _, password = decoded.partition(':')
+        if user == '' or password == '' or '\n' in password:
+            return None, None
+        return user, password
+
     def user_object_from_credentials(
              self,
              user_email: str,
@@ -96,7 +223,12 @@ class BasicAuth(Auth):
            - A User object or None if authentication fails.
         """
         auth_header = self.authorization_header(request)
-        b64_auth_token = self.extract_base64_authorization_header(auth_header)
-        auth_token = self.decode_base64_authorization_header(b64_auth_token)
-        email, password = self.extract_user_credentials(auth_token)
-        return self.user_object_from_credentials(email, password)
+        if type(auth_header) == str:
+            user = self.credential_cache.get(auth_header)
+            if user is not None:
+                return user
+        email, password = self.parse_authorization_header(auth_header)
+        user = self.user_object_from_credentials(email, password)
+        if user is not None:
+            self.credential_cache.put(auth_header, user)
+        return user
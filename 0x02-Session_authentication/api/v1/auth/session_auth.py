@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 
 """Module for session authentication"""
+import os
 import uuid
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import ShardedSessionStore
 from models.user import User
 
 
 class SessionAuth(Auth):
     """Session authentication class."""
-    user_id_by_session_id = {}
+    user_id_by_session_id = ShardedSessionStore(
+        int(os.getenv('SESSION_STORE_SHARDS', '16')),
+        int(os.getenv('SESSION_STORE_MAX', '0')))
 
     def create_session(self, user_id: str = None) -> str:
         """Creates a Session ID for a user_id."""
@@ -60,7 +64,16 @@ class SessionAuth(Auth):
             return False
 
         # If the session ID exists in the session store, delete it
-        if session_id in self.user_id_by_session_id:
-            del self.user_id_by_session_id[session_id]
+        self.user_id_by_session_id.pop(session_id)
 
         return True
+
+    def destroy_all_sessions(self, user_id: str = None) -> int:
+        """Destroys every session of a user.
+
+        Returns:
+        - The number of sessions destroyed.
+        """
+        if user_id is None or not isinstance(user_id, str):
+            return 0
+        return self.user_id_by_session_id.destroy_user(user_id)
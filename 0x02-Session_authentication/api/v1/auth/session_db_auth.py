@@ -62,3 +62,20 @@ class SessionDBAuth(SessionExpAuth):
         # Remove the session from the database
         sessions[0].remove()
         return True
+
+    def destroy_all_sessions(self, user_id: str = None) -> int:
+        """Destroys every session of a user, in memory and stored.
+        """
+        if user_id is None or not isinstance(user_id, str):
+            return 0
+        session_ids = set(self.user_id_by_session_id.sessions_of(user_id))
+        super().destroy_all_sessions(user_id)
+        try:
+            # Stored sessions of the user, including other processes' ones
+            sessions = UserSession.search({'user_id': user_id})
+        except Exception:
+            sessions = []
+        for user_session in sessions:
+            session_ids.add(user_session.session_id)
+            user_session.remove()
+        return len(session_ids)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Module of the in-memory session store."""
+import threading
+from typing import Iterator, List
+
+
+class ShardedSessionStore:
+    """Session ID to session mapping split across locked shards.
+    A session is the user ID (SessionAuth) or a dict holding it under
+    'user_id' (SessionExpAuth). Each shard has its own lock, so
+    threads working on different sessions rarely wait for each other,
+    and keeps the session IDs of each user. With maxsize set, creating
+    a session past maxsize in total drops the oldest session of the
+    shard written to (or of the next non-empty one).
+    """
+
+    def __init__(self, shards: int = 16, maxsize: int = 0) -> None:
+        """Initializes empty shards."""
+        self.shards = [{} for _ in range(shards)]
+        self.by_user = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.contended = [0] * shards
+        self.evicted = [0] * shards
+        self.maxsize = maxsize
+        self.size = 0
+        self.size_lock = threading.Lock()
+
+    @staticmethod
+    def user_id_of(session) -> str:
+        """Returns the user ID of a session."""
+        if isinstance(session, dict):
+            return session.get('user_id')
+        return session
+
+    def shard(self, session_id: str) -> int:
+        """Returns the shard of a session ID."""
+        return hash(session_id) % len(self.shards)
+
+    def lock(self, i: int) -> threading.Lock:
+        """Acquires the lock of shard i, counting the times it was busy."""
+        lock = self.locks[i]
+        if not lock.acquire(blocking=False):
+            lock.acquire()
+            self.contended[i] += 1
+        return lock
+
+    def unindex(self, i: int, session_id: str, session) -> None:
+        """Removes a session from the user index, the lock being held."""
+        user_id = self.user_id_of(session)
+        ids = self.by_user[i].get(user_id)
+        if ids is not None:
+            ids.discard(session_id)
+            if len(ids) == 0:
+                del self.by_user[i][user_id]
+
+    def resize(self, delta: int) -> bool:
+        """Adds delta to the total size, tells if it is over maxsize."""
+        with self.size_lock:
+            self.size += delta
+            return 0 < self.maxsize < self.size
+
+    def evict(self, i: int, keep: str) -> None:
+        """Drops the oldest session other than keep, from shard i or
+        else the next shard having one.
+        """
+        for j in range(i, i + len(self.shards)):
+            j %= len(self.shards)
+            lock = self.lock(j)
+            try:
+                oldest = next((session_id for session_id in self.shards[j]
+                               if session_id != keep), None)
+                if oldest is not None:
+                    self.unindex(j, oldest, self.shards[j].pop(oldest))
+                    self.evicted[j] += 1
+            finally:
+                lock.release()
+            if oldest is not None:
+                self.resize(-1)
+                return
+
+    def __setitem__(self, session_id: str, session) -> None:
+        """Creates or replaces a session."""
+        i = self.shard(session_id)
+        shard = self.shards[i]
+        created = True
+        lock = self.lock(i)
+        try:
+            if session_id in shard:
+                self.unindex(i, session_id, shard.pop(session_id))
+                created = False
+            shard[session_id] = session
+            user_ids = self.by_user[i]
+            user_id = self.user_id_of(session)
+            if user_id not in user_ids:
+                user_ids[user_id] = set()
+            user_ids[user_id].add(session_id)
+        finally:
+            lock.release()
+        # Evicting outside the shard lock never holds two shard locks
+        if created and self.resize(1):
+            self.evict(i, session_id)
+
+    def __getitem__(self, session_id: str):
+        """Returns a session, raises KeyError if there is none."""
+        # A single dict read is atomic, no need for the lock
+        return self.shards[self.shard(session_id)][session_id]
+
+    def get(self, session_id: str, default=None):
+        """Returns a session or default."""
+        return self.shards[self.shard(session_id)].get(session_id, default)
+
+    def __contains__(self, session_id: str) -> bool:
+        """Checks if a session exists."""
+        return session_id in self.shards[self.shard(session_id)]
+
+    def pop(self, session_id: str, default=None):
+        """Destroys a session and returns it, or default."""
+        i = self.shard(session_id)
+        lock = self.lock(i)
+        try:
+            session = self.shards[i].pop(session_id, None)
+            if session is None:
+                return default
+            self.unindex(i, session_id, session)
+        finally:
+            lock.release()
+        self.resize(-1)
+        return session
+
+    def __delitem__(self, session_id: str) -> None:
+        """Destroys a session, raises KeyError if there is none."""
+        if self.pop(session_id) is None:
+            raise KeyError(session_id)
+
+    def __len__(self) -> int:
+        """Returns the number of sessions."""
+        return self.size
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over a snapshot of the session IDs."""
+        for i in range(len(self.shards)):
+            lock = self.lock(i)
+            try:
+                session_ids = list(self.shards[i])
+            finally:
+                lock.release()
+            yield from session_ids
+
+    def sessions_of(self, user_id: str) -> List[str]:
+        """Returns the session IDs of a user."""
+        session_ids = []
+        for i in range(len(self.shards)):
+            lock = self.lock(i)
+            try:
+                session_ids.extend(self.by_user[i].get(user_id, ()))
+            finally:
+                lock.release()
+        return session_ids
+
+    def destroy_user(self, user_id: str) -> int:
+        """Destroys every session of a user, returns how many."""
+        count = 0
+        for i in range(len(self.shards)):
+            lock = self.lock(i)
+            try:
+                for session_id in self.by_user[i].pop(user_id, ()):
+                    del self.shards[i][session_id]
+                    count += 1
+            finally:
+                lock.release()
+        self.resize(-count)
+        return count
+
+    def stats(self) -> dict:
+        """Returns the size, lock contention and eviction counters."""
+        return {
+            'sessions': len(self),
+            'shards': len(self.shards),
+            'contended': sum(self.contended),
+            'evicted': sum(self.evicted),
+        }
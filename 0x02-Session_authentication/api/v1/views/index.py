@@ -18,10 +18,21 @@ def stats() -> str:
     """GET /api/v1/stats
     Return:
       - The number of each object.
+      - The storage counters (objects, changes, files, last_flush,
+        load) and the number of sessions, all kept up to date as
+        objects change so polling costs no scan.
     """
+    from api.v1.auth.session_auth import SessionAuth
+    from models.base import stats as storage_stats
     from models.user import User
+    from models.user_session import UserSession
     stats = {}
     stats['users'] = User.count()
+    stats['sessions'] = {
+        'memory': len(SessionAuth.user_id_by_session_id),
+        'stored': UserSession.count(),
+    }
+    stats.update(storage_stats())
     return jsonify(stats)
 
 
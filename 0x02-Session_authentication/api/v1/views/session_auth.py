@@ -33,7 +33,11 @@ def login() -> Tuple[str, int]:
     if len(users) <= 0:
         return jsonify(not_found_res), 404
     # Validate the password for the found user
-    if users[0].is_valid_password(password):
+    try:
+        valid = users[0].is_valid_password(password)
+    except TimeoutError:
+        abort(503)  # Too many password checks pending
+    if valid:
         from api.v1.app import auth  # Import auth only when needed
         # Create a session ID for the user
         sessiond_id = auth.create_session(getattr(users[0], 'id'))
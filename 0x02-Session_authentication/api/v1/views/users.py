@@ -2,18 +2,105 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
+from datetime import datetime
+from models.base import ORDER_KEYS, TIMESTAMP_FORMAT, Base, sort_key
 from models.user import User
+import json
+
+QUERY_ARGS = ('email', 'email_prefix', 'created_after', 'created_before',
+              'desc', 'count')
+SORTABLE = Base.__slots__ + User.__slots__
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (all optional):
+      - limit: maximum number of users to return
+      - cursor: value of the X-Next-Cursor header of the previous page
+      - order_by: id (default), created_at or updated_at; any other
+        attribute is served by query_users
+      - format: ndjson to stream one User JSON object per line
     Return:
       - list of all User objects JSON represented
+      - with limit, the X-Next-Cursor header when there may be more
+      - 400 if a query parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    if len(request.args) == 0:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+    order_by = request.args.get('order_by', 'id')
+    if order_by not in ORDER_KEYS or \
+            any(arg in request.args for arg in QUERY_ARGS):
+        return query_users()
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    try:
+        limit = None if limit is None else int(limit)
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be positive")
+        users = User.scan(order_by, cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # A page is read before answering, to know its cursor
+    if limit is not None:
+        users = list(users)
+    if request.args.get('format') == 'ndjson':
+        lines = (json.dumps(user.to_json()) + "\n" for user in users)
+        res = Response(lines, mimetype='application/x-ndjson')
+    else:
+        res = jsonify([user.to_json() for user in users])
+    if limit is not None and len(users) == limit:
+        res.headers['X-Next-Cursor'] = sort_key(users[-1], order_by)
+    return res
+
+
+def query_users() -> str:
+    """ GET /api/v1/users with search parameters
+    Query parameters (all optional):
+      - email: exact email
+      - email_prefix: beginning of the email
+      - created_after, created_before: inclusive bounds of created_at,
+        in the %Y-%m-%dT%H:%M:%S format
+      - order_by: attribute to sort on, desc=1 for the reverse order
+      - limit: maximum number of users to return
+      - count: 1 to only return {"count": <number of matches>}
+    Return:
+      - list of the matching User objects JSON represented
+      - 400 if a query parameter is invalid, or cursor is given
+    """
+    args = request.args
+    where, between, prefix = {}, {}, {}
+    try:
+        if 'email' in args:
+            where['email'] = args['email']
+        if 'email_prefix' in args:
+            prefix['email'] = args['email_prefix']
+        low, high = args.get('created_after'), args.get('created_before')
+        if low is not None or high is not None:
+            between['created_at'] = tuple(
+                None if v is None else datetime.strptime(v, TIMESTAMP_FORMAT)
+                for v in (low, high))
+        limit = args.get('limit')
+        limit = None if limit is None else int(limit)
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be positive")
+        if 'cursor' in args:
+            raise ValueError("cursor needs order_by {} and no search".format(
+                ', '.join(ORDER_KEYS)))
+        order_by = args.get('order_by')
+        if order_by is not None and (order_by.startswith('_') or
+                                     order_by not in SORTABLE):
+            raise ValueError("invalid order_by {}".format(order_by))
+        res = User.query(where, between, prefix, order_by,
+                         args.get('desc') == '1', limit,
+                         args.get('count') == '1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if args.get('count') == '1':
+        return jsonify({'count': res})
+    return jsonify([user.to_json() for user in res])
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -2,20 +2,531 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from itertools import islice
+from typing import TypeVar, List, Iterable, Iterator, Union
+from os import getenv, path
+import atexit
+import bisect
+import heapq
+import io
 import json
+import logging
+import os
+import resource
+import threading
+import time
 import uuid
+import zlib
+
+from models.serializers import SERIALIZERS
+from models.sqlite_storage import SQLiteStorage
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+SORTED_INDEXES = {}
+SCAN_INDEXES = {}
+# "memory" keeps the objects in DATA, per process, persisted to files;
+# "sqlite" shares them between processes through STORAGE_PATH
+STORAGE = getenv("STORAGE", "memory")
+STORAGE_PATH = getenv("STORAGE_PATH", ".db.sqlite3")
+STORES = {}
+# Attributes Base.scan can order by
+ORDER_KEYS = ('id', 'created_at', 'updated_at')
+# Build objects on first access instead of when the file is loaded
+LAZY_LOAD = getenv("LAZY_LOAD", "0") == "1"
+LOAD_STATS = {}
+# Saves and removes per class, and bytes of each store file, kept up to
+# date by the code making the changes so stats() never scans
+CHANGES = {}
+CHANGES_LOCK = threading.Lock()
+# Callbacks run with (obj, kind) after each save or remove, per class
+LISTENERS = {}
+FILE_SIZES = {}
+# Snapshot file format, a key of models.serializers.SERIALIZERS
+DB_FORMAT = getenv("DB_FORMAT", "json")
+# Append a CRC32 footer to snapshots; load_from_file then requires it
+CHECKSUM = getenv("DB_CHECKSUM", "0") == "1"
+FOOTER = b"\n#crc32:"
+FOOTER_SIZE = len(FOOTER) + 9
+# One lock per class serializing its snapshot writes
+WRITE_LOCKS = {}
+# "snapshot" rewrites .db_<Class>.json on every change, "log" appends
+# the change to .db_<Class>.log and compacts it in the background,
+# "deferred" marks the class dirty and rewrites it from a flusher thread
+PERSISTENCE = getenv("PERSISTENCE", "snapshot")
+COMPACT_THRESHOLD = int(getenv("COMPACT_THRESHOLD", "1000"))
+LOGS = {}
+# In "deferred" mode a crash loses the changes of at most the last
+# FLUSH_INTERVAL seconds, or FLUSH_BATCH changes of a class if sooner
+FLUSH_INTERVAL = float(getenv("FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH = int(getenv("FLUSH_BATCH", "100"))
+DIRTY = {}
+DIRTY_COND = threading.Condition()
+FLUSH_LOCK = threading.Lock()
+FLUSHER = {}
+
+
+def flush():
+    """ Write every dirty class to its file
+    Durability barrier: all changes made before the call are on disk
+    when it returns. A class whose write fails stays dirty for the next
+    flush, the others are still written, then the first error is raised
+    """
+    with FLUSH_LOCK:
+        with DIRTY_COND:
+            dirty = list(DIRTY.items())
+            DIRTY.clear()
+        error = None
+        for s_class, (cls, pending) in dirty:
+            try:
+                cls.save_to_file()
+            except Exception as e:
+                error = error or e
+                with DIRTY_COND:
+                    pending += DIRTY.get(s_class, (cls, 0))[1]
+                    DIRTY[s_class] = (cls, pending)
+        if error is not None:
+            raise error
+        FLUSHER['last_flush'] = datetime.utcnow()
+
+
+def _flusher():
+    """ Flush loop of the background flusher thread
+    A failed flush is logged and retried at the next interval
+    """
+    while True:
+        with DIRTY_COND:
+            DIRTY_COND.wait(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception("deferred flush failed")
+
+
+atexit.register(flush)
+
+
+def write_atomic(file_path: str, data: bytes):
+    """ Replace file_path with data, never leaving a partial file
+    data goes to a temporary file which is fsynced then renamed over
+    file_path, and the rename itself is fsynced
+    """
+    tmp_path = "{}.{}-{}.tmp".format(file_path, os.getpid(),
+                                     threading.get_ident())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    FILE_SIZES[file_path] = len(data)
+    dir_fd = os.open(path.dirname(path.abspath(file_path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def open_checked(file_path: str, binary: bool, required: bool = None):
+    """ Open a snapshot file, checking its checksum footer if any
+    A file with a footer is read and checked in full before parsing;
+    raises ValueError if the checksum does not match, or if the footer
+    is missing while required (CHECKSUM by default)
+    """
+    f = open(file_path, 'rb')
+    size = f.seek(0, io.SEEK_END)
+    footer = b""
+    if size >= FOOTER_SIZE:
+        f.seek(size - FOOTER_SIZE)
+        footer = f.read()
+    f.seek(0)
+    if not footer.startswith(FOOTER) and \
+            (CHECKSUM if required is None else required):
+        f.close()
+        raise ValueError("{}: checksum footer missing".format(file_path))
+    if not footer.startswith(FOOTER):
+        return f if binary else io.TextIOWrapper(f, encoding="utf-8")
+    with f:
+        data = f.read(size - FOOTER_SIZE)
+    if b"%08x\n" % zlib.crc32(data) != footer[len(FOOTER):]:
+        raise ValueError("{}: checksum mismatch".format(file_path))
+    return io.BytesIO(data) if binary else io.StringIO(data.decode())
+
+
+def snapshot_source(s_class: str) -> tuple:
+    """ Return (serializer, file_path, migrate) of the snapshot to load
+    The DB_FORMAT file, else the newest file of another format, to
+    migrate to DB_FORMAT
+    """
+    serializer = SERIALIZERS[DB_FORMAT]
+    file_path = ".db_{}.{}".format(s_class, serializer.extension)
+    if path.exists(file_path):
+        return serializer, file_path, False
+    others = []
+    for other in SERIALIZERS.values():
+        other_path = ".db_{}.{}".format(s_class, other.extension)
+        if other is not serializer and path.exists(other_path):
+            others.append((path.getmtime(other_path), other, other_path))
+    if len(others) > 0:
+        _, other, other_path = max(others, key=lambda x: x[0])
+        return other, other_path, True
+    return serializer, file_path, False
+
+
+def log_paths(s_class: str) -> List[str]:
+    """ Return the change log files of a class, in replay order
+    """
+    log_path = ".db_{}.log".format(s_class)
+    return [file_path for file_path in (log_path + ".compacting", log_path)
+            if path.exists(file_path)]
+
+
+def log_entries(file_path: str) -> Iterator[tuple]:
+    """ Iterate over the (id, JSON or None if removed) changes of a log
+    A truncated last line (crash while appending) is ignored
+    """
+    with open(file_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            yield entry['id'], entry['obj']
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    fromisoformat reads this fixed format many times faster than strptime
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class LazyObjects(dict):
+    """ Objects of a class kept as JSON dicts until first accessed
+    """
+
+    def __init__(self, cls: type, objs_json: dict):
+        """ Initialize from the loaded JSON of each object
+        """
+        super().__init__(objs_json)
+        self.cls = cls
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Return an object, building it if needed
+        """
+        value = super().__getitem__(obj_id)
+        if type(value) is dict:
+            value = self.cls(**value)
+            super().__setitem__(obj_id, value)
+        return value
+
+    def get(self, obj_id: str, default=None) -> TypeVar('Base'):
+        """ Return an object or default
+        """
+        if obj_id in self:
+            return self[obj_id]
+        return default
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ Return all objects, building the missing ones
+        """
+        return [self[obj_id] for obj_id in list(self.keys())]
+
+    def items(self) -> List[tuple]:
+        """ Return all (id, object) pairs, building the missing ones
+        """
+        return [(obj_id, self[obj_id]) for obj_id in list(self.keys())]
+
+
+def attr_values(objs: dict, attr: str) -> Iterator[tuple]:
+    """ Iterate over (id, value of attr) of objs
+    Objects of a LazyObjects still in JSON form are read without being
+    built, timestamps parsed like Base.__init__ does
+    """
+    for obj_id, obj in dict.items(objs):
+        if type(obj) is dict:
+            value = obj.get(attr)
+            if value is not None and attr in ('created_at', 'updated_at'):
+                value = parse_timestamp(value)
+        else:
+            value = getattr(obj, attr, None)
+        yield obj_id, value
+
+
+class Index():
+    """ Equality index over one attribute of a class
+    Holds object ids, resolved through objs (the DATA of the class) so
+    lazily loaded objects are only built when returned
+    """
+
+    def __init__(self, attr: str, unique: bool = False, objs: dict = {}):
+        """ Initialize an empty index
+        """
+        self.attr = attr
+        self.unique = unique
+        self.objs = objs
+        self.entries = {}
+        self.values = {}
+
+    def check(self, obj: TypeVar('Base')):
+        """ Raise ValueError if obj would break a unique index
+        """
+        value = getattr(obj, self.attr, None)
+        if not self.unique or value is None:
+            return
+        for obj_id in self.entries.get(value, {}):
+            if obj_id != obj.id:
+                raise ValueError("duplicate {}: {}".format(self.attr, value))
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current attribute value
+        """
+        self.add_value(obj.id, getattr(obj, self.attr, None))
+
+    def add_value(self, obj_id: str, value):
+        """ Index an object id under value
+        """
+        if obj_id in self.values and self.values[obj_id] == value:
+            return
+        self.discard(obj_id)
+        self.entries.setdefault(value, {})[obj_id] = None
+        self.values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = self.entries[value]
+        del bucket[obj_id]
+        if len(bucket) == 0:
+            del self.entries[value]
+
+    def get(self, value) -> List[TypeVar('Base')]:
+        """ Return all objects indexed under value
+        """
+        return [self.objs[obj_id] for obj_id in self.entries.get(value, {})]
+
+
+class Top():
+    """ Sorts after any other value
+    """
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+TOP = Top()
+
+
+class SortedIndex():
+    """ Ordered index over one attribute of a class
+    Serves range and prefix queries and ordered scans. Objects whose
+    value is None (or not comparable with the others) are kept apart
+    and sort last. Holds object ids, resolved through objs like Index.
+    """
+
+    def __init__(self, attr: str, objs: dict = {}):
+        """ Initialize an empty index
+        """
+        self.attr = attr
+        self.objs = objs
+        self.keys = []
+        self.values = {}
+        self.others = set()
+
+    def check(self, obj: TypeVar('Base')):
+        """ Sorted indexes are never unique
+        """
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current attribute value
+        """
+        self.add_value(obj.id, getattr(obj, self.attr, None))
+
+    def add_value(self, obj_id: str, value):
+        """ Index an object id under value
+        """
+        if obj_id in self.values and self.values[obj_id] == value:
+            return
+        self.discard(obj_id)
+        try:
+            if value is None:
+                raise TypeError
+            bisect.insort(self.keys, (value, obj_id))
+        except TypeError:
+            self.others.add(obj_id)
+            return
+        self.values[obj_id] = value
+
+    def build(self, pairs: Iterable[tuple]):
+        """ Index many (id, value) pairs at once
+        The keys are sorted in one pass instead of inserted one by one;
+        if the values can't all be compared, they are added one by one
+        so the incomparable ones end up in others like add_value does
+        """
+        keys = []
+        for obj_id, value in pairs:
+            if value is None:
+                self.others.add(obj_id)
+            else:
+                keys.append((value, obj_id))
+        try:
+            keys.sort()
+        except TypeError:
+            for value, obj_id in keys:
+                self.add_value(obj_id, value)
+            return
+        self.keys = keys
+        self.values = {obj_id: value for value, obj_id in keys}
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        self.others.discard(obj_id)
+        if obj_id not in self.values:
+            return
+        key = (self.values.pop(obj_id), obj_id)
+        del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def range(self, low=None, high=None,
+              reverse: bool = False) -> Iterator[TypeVar('Base')]:
+        """ Iterate over objects with low <= value <= high, in order
+        """
+        lo, hi = 0, len(self.keys)
+        if low is not None:
+            lo = bisect.bisect_left(self.keys, (low,))
+        if high is not None:
+            hi = bisect.bisect_right(self.keys, (high, TOP))
+        positions = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        for i in positions:
+            yield self.objs[self.keys[i][1]]
+
+    def prefix(self, prefix: str,
+               reverse: bool = False) -> Iterator[TypeVar('Base')]:
+        """ Iterate over objects whose value starts with prefix
+        """
+        return self.range(prefix, prefix + chr(0x10ffff), reverse)
+
+    def ordered(self, reverse: bool = False) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects, None values last
+        """
+        others = [self.objs[obj_id]
+                  for obj_id in sorted(self.others, reverse=reverse)]
+        if reverse:
+            yield from others
+        yield from self.range(reverse=reverse)
+        if not reverse:
+            yield from others
+
+
+class ScanIndex(SortedIndex):
+    """ Ordered index of sort_key(obj, attr), attr one of ORDER_KEYS
+    Serves the pages of Base.scan from their cursor on
+    """
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current sort key
+        """
+        self.add_value(obj.id, sort_key(obj, self.attr))
+
+    def after(self, key: str = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate over objects whose sort key is greater than key
+        """
+        lo = 0
+        if key is not None:
+            lo = bisect.bisect_right(self.keys, (key, TOP))
+        for i in range(lo, len(self.keys)):
+            yield self.objs[self.keys[i][1]]
+
+
+def sort_keys(objs: dict, order_by: str) -> Iterator[tuple]:
+    """ Iterate over (id, sort_key(obj, order_by)) of objs
+    Objects of a LazyObjects still in JSON form are read without being
+    built: their timestamps are already in TIMESTAMP_FORMAT
+    """
+    for obj_id, obj in dict.items(objs):
+        if type(obj) is dict and order_by == 'id':
+            yield obj_id, obj_id
+        elif type(obj) is dict and obj.get(order_by) is not None:
+            yield obj_id, "{} {}".format(obj[order_by], obj_id)
+        else:
+            yield obj_id, sort_key(objs[obj_id], order_by)
+
+
+class Query():
+    """ Predicates, order and limit of a Base.query
+    """
+
+    def __init__(self, where: dict = {}, between: dict = {},
+                 prefix: dict = {}, order_by: str = None,
+                 descending: bool = False, limit: int = None,
+                 count_only: bool = False):
+        """ Initialize a query
+          - where: {attribute: value} equalities
+          - between: {attribute: (low, high)} inclusive ranges, None
+            for an open end
+          - prefix: {attribute: prefix} string prefixes
+        """
+        self.where = where
+        self.between = between
+        self.prefix = prefix
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+        self.count_only = count_only
+
+    def match(self, obj: TypeVar('Base')) -> bool:
+        """ Tell if obj satisfies every predicate
+        """
+        for k, v in self.where.items():
+            if getattr(obj, k) != v:
+                return False
+        for k, (low, high) in self.between.items():
+            value = getattr(obj, k)
+            if value is None:
+                return False
+            if (low is not None and value < low) or \
+                    (high is not None and value > high):
+                return False
+        for k, v in self.prefix.items():
+            value = getattr(obj, k)
+            if type(value) is not str or not value.startswith(v):
+                return False
+        return True
+
+    def key(self, obj: TypeVar('Base')) -> tuple:
+        """ Sort key of obj, None values last and ties broken by id
+        """
+        value = getattr(obj, self.order_by)
+        return (value is None, value, obj.id)
 
 
 class Base():
     """ Base class
+    Attributes are declared in __slots__ so instances carry no __dict__
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at')
+
+    # Attributes indexed for O(1) equality search, kept by save/remove
+    INDEXES = ()
+    UNIQUE_INDEXES = ()
+    # Attributes indexed in order for range, prefix and sorted queries
+    SORTED_INDEXES = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -25,13 +536,11 @@ class Base():
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,11 +553,31 @@ class Base():
             return False
         return (self.id == other.id)
 
+    @classmethod
+    def attributes(cls) -> List[str]:
+        """ Return the slot names of the class, base classes first
+        """
+        if '_attributes' not in cls.__dict__:
+            cls._attributes = [
+                key for klass in reversed(cls.__mro__)
+                for key in klass.__dict__.get('__slots__', ())
+            ]
+        return cls._attributes
+
+    def items(self) -> Iterable[tuple]:
+        """ Return the (name, value) pairs set on the object
+        """
+        for key in self.attributes():
+            if hasattr(self, key):
+                yield key, getattr(self, key)
+        if hasattr(self, '__dict__'):
+            yield from self.__dict__.items()
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self.items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -58,55 +587,225 @@ class Base():
         return result
 
     @classmethod
-    def load_from_file(cls):
-        """ Load all objects from file
+    def load_from_file(cls, lazy: bool = None):
+        """ Load all objects from the storage backend
+        Load time and the peak RSS of the process so far (the load's
+        own peak if it is the largest allocation yet) go to LOAD_STATS
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        start = time.perf_counter()
+        storage().load(cls, lazy)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        LOAD_STATS[cls.__name__] = {
+            'objects': cls.count(),
+            'seconds': time.perf_counter() - start,
+            'process_max_rss_kb': usage.ru_maxrss,
+        }
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
+    @classmethod
+    def replay_log(cls, file_path: str) -> int:
+        """ Apply the changes recorded in a log file, return how many
+        """
+        s_class = cls.__name__
+        count = 0
+        for obj_id, obj_json in log_entries(file_path):
+            if obj_json is None:
+                DATA[s_class].pop(obj_id, None)
+            else:
                 DATA[s_class][obj_id] = cls(**obj_json)
+            count += 1
+        return count
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to file, in the DB_FORMAT format
+        The file is replaced atomically, with a checksum if CHECKSUM.
+        Only the copy of the objects is made under the storage lock;
+        writes of a class are serialized, so the last copy is written
+        last. Objects a LazyObjects hasn't built are written as loaded.
+        """
+        s_class = cls.__name__
+        serializer = SERIALIZERS[DB_FORMAT]
+        file_path = ".db_{}.{}".format(s_class, serializer.extension)
+        with WRITE_LOCKS.setdefault(s_class, threading.Lock()):
+            with storage().lock:
+                objs = dict.copy(DATA.setdefault(s_class, {}))
+            objs_json = {}
+            for obj_id, obj in objs.items():
+                if type(obj) is dict:
+                    objs_json[obj_id] = obj
+                else:
+                    objs_json[obj_id] = obj.to_json(True)
+
+            f = io.BytesIO() if serializer.binary else io.StringIO()
+            serializer.dump(objs_json, f)
+            data = f.getvalue()
+            if not serializer.binary:
+                data = data.encode()
+            if CHECKSUM:
+                data += FOOTER + b"%08x\n" % zlib.crc32(data)
+            write_atomic(file_path, data)
+
+    @classmethod
+    def log(cls) -> dict:
+        """ Return the change log state of the class
+        """
+        s_class = cls.__name__
+        if LOGS.get(s_class) is None:
+            LOGS.setdefault(s_class, {
+                'lock': threading.Lock(),
+                'entries': 0,
+                'compacting': False,
+            })
+        return LOGS[s_class]
+
+    @classmethod
+    def append_to_log(cls, obj_id: str, obj_json: dict = None):
+        """ Append one change (obj_json None for a removal) to the log
+        Starts a background compaction every COMPACT_THRESHOLD entries
+        """
+        log_path = ".db_{}.log".format(cls.__name__)
+        line = json.dumps({'id': obj_id, 'obj': obj_json}) + "\n"
+        log = cls.log()
+        with log['lock']:
+            with open(log_path, 'a') as f:
+                f.write(line)
+            FILE_SIZES[log_path] = FILE_SIZES.get(log_path, 0) + len(line)
+            log['entries'] += 1
+            if log['entries'] < COMPACT_THRESHOLD or log['compacting']:
+                return
+            log['compacting'] = True
+        threading.Thread(target=cls.compact, daemon=True).start()
+
+    @classmethod
+    def compact(cls):
+        """ Fold the change log into the snapshot file
+        The log is renamed first so appends go on in a new one; the
+        renamed log is only deleted once the snapshot is written
+        """
+        log_path = ".db_{}.log".format(cls.__name__)
+        log = cls.log()
+        try:
+            with log['lock']:
+                log['compacting'] = True
+                if not path.exists(log_path):
+                    return
+                if not path.exists(log_path + ".compacting"):
+                    os.replace(log_path, log_path + ".compacting")
+                    FILE_SIZES[log_path + ".compacting"] = \
+                        FILE_SIZES.pop(log_path, 0)
+                log['entries'] = 0
+            cls.save_to_file()
+            os.remove(log_path + ".compacting")
+            FILE_SIZES.pop(log_path + ".compacting", None)
+        finally:
+            log['compacting'] = False
+
+    @classmethod
+    def mark_dirty(cls):
+        """ Schedule the class for the next flush
+        Wakes the flusher up once FLUSH_BATCH changes are pending
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with DIRTY_COND:
+            pending = DIRTY.get(s_class, (cls, 0))[1] + 1
+            DIRTY[s_class] = (cls, pending)
+            if FLUSHER.get('thread') is None:
+                FLUSHER['thread'] = threading.Thread(target=_flusher,
+                                                     daemon=True)
+                FLUSHER['thread'].start()
+            if pending >= FLUSH_BATCH:
+                DIRTY_COND.notify()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    def persist(self, removed: bool = False):
+        """ Write the change to this object according to PERSISTENCE
+        """
+        if PERSISTENCE == "log":
+            obj_json = None if removed else self.to_json(True)
+            self.__class__.append_to_log(self.id, obj_json)
+        elif PERSISTENCE == "deferred":
+            self.__class__.mark_dirty()
+        else:
+            self.__class__.save_to_file()
+
+    @classmethod
+    def indexes(cls) -> dict:
+        """ Return the indexes of the class, building them if needed
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES[s_class] = {}
+            objs = DATA.setdefault(s_class, {})
+            for attr in cls.INDEXES + cls.UNIQUE_INDEXES:
+                index = Index(attr, attr in cls.UNIQUE_INDEXES, objs)
+                for obj_id, value in attr_values(objs, attr):
+                    index.add_value(obj_id, value)
+                INDEXES[s_class][attr] = index
+        return INDEXES[s_class]
+
+    @classmethod
+    def sorted_indexes(cls) -> dict:
+        """ Return the sorted indexes of the class, building them if needed
+        """
+        s_class = cls.__name__
+        if SORTED_INDEXES.get(s_class) is None:
+            SORTED_INDEXES[s_class] = {}
+            objs = DATA.setdefault(s_class, {})
+            for attr in cls.SORTED_INDEXES:
+                index = SortedIndex(attr, objs)
+                index.build(attr_values(objs, attr))
+                SORTED_INDEXES[s_class][attr] = index
+        return SORTED_INDEXES[s_class]
+
+    @classmethod
+    def scan_index(cls, order_by: str) -> ScanIndex:
+        """ Return the scan index of order_by, building it if needed
+        Kept up to date by save/remove once built
+        """
+        s_class = cls.__name__
+        scan_indexes = SCAN_INDEXES.setdefault(s_class, {})
+        if scan_indexes.get(order_by) is None:
+            index = ScanIndex(order_by, DATA.setdefault(s_class, {}))
+            index.build(sort_keys(index.objs, order_by))
+            scan_indexes[order_by] = index
+        return scan_indexes[order_by]
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage().save(self)
+        self.changed('saves')
 
     def remove(self):
         """ Remove object
         """
+        storage().remove(self)
+        self.changed('removes')
+
+    def changed(self, kind: str):
+        """ Count one change of kind ('saves' or 'removes') in CHANGES
+        and tell the listeners of the class
+        """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with CHANGES_LOCK:
+            if CHANGES.get(s_class) is None:
+                CHANGES[s_class] = {'saves': 0, 'removes': 0}
+            CHANGES[s_class][kind] += 1
+        for callback in LISTENERS.get(s_class, ()):
+            callback(self, kind)
+
+    @classmethod
+    def listen(cls, callback):
+        """ Call callback(obj, kind) after each save or remove of an
+        object of the class, kind being 'saves' or 'removes'
+        """
+        LISTENERS.setdefault(cls.__name__, []).append(callback)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage().count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,13 +817,206 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage().get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
+        return storage().search(cls, attributes)
+
+    @classmethod
+    def scan(cls, order_by: str = 'id', after: str = None,
+             limit: int = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate over objects in a stable order
+        Objects are sorted by sort_key(obj, order_by); only the ones
+        whose key is greater than after are returned, at most limit.
+        """
+        if order_by not in ORDER_KEYS:
+            raise ValueError("order_by must be one of {}".format(
+                ', '.join(ORDER_KEYS)))
+        return storage().scan(cls, order_by, after, limit)
+
+    @classmethod
+    def query(cls, where: dict = {}, between: dict = {}, prefix: dict = {},
+              order_by: str = None, descending: bool = False,
+              limit: int = None,
+              count_only: bool = False) -> Union[List[TypeVar('Base')], int]:
+        """ Search objects with equality, range and prefix predicates
+          - where: {attribute: value} equalities
+          - between: {attribute: (low, high)} inclusive ranges, None
+            for an open end
+          - prefix: {attribute: prefix} string prefixes
+          - order_by/descending/limit: sort and cut the result
+          - count_only: return the number of matches instead
+        Uses SORTED_INDEXES so ranges and ordered pages don't scan
+        the whole class.
+        """
+        q = Query(where, between, prefix, order_by, descending, limit,
+                  count_only)
+        return storage().query(cls, q)
+
+
+def sort_key(obj: Base, order_by: str) -> str:
+    """ Return the key of obj in the order_by order, unique per object
+    Timestamps have a fixed width, so keys sort in time order
+    """
+    if order_by == 'id':
+        return obj.id
+    value = getattr(obj, order_by)
+    return "{} {}".format(value.strftime(TIMESTAMP_FORMAT), obj.id)
+
+
+def stats() -> dict:
+    """ Return the counters of the storage, without scanning objects
+      - objects: number of objects per class
+      - changes: saves and removes per class since the start
+      - files: size in bytes of each store file
+      - last_flush: time of the last deferred flush
+      - load: LOAD_STATS of each loaded class
+    """
+    last_flush = FLUSHER.get('last_flush')
+    with CHANGES_LOCK:
+        changes = {k: dict(v) for k, v in CHANGES.items()}
+    return {
+        'objects': storage().counts(),
+        'changes': changes,
+        'files': storage().file_sizes(),
+        'last_flush': last_flush and last_flush.strftime(TIMESTAMP_FORMAT),
+        'load': {k: dict(v) for k, v in LOAD_STATS.items()},
+    }
+
+
+def storage():
+    """ Return the storage backend selected by STORAGE
+    """
+    if STORES.get(STORAGE) is None:
+        if STORAGE == "sqlite":
+            STORES.setdefault(STORAGE, SQLiteStorage(STORAGE_PATH))
+        else:
+            STORES.setdefault(STORAGE, MemoryStorage())
+    return STORES[STORAGE]
+
+
+class MemoryStorage():
+    """ Objects of each class in DATA, guarded by one lock
+    Changes are persisted to the .db_<Class> files per PERSISTENCE.
+    Log and deferred changes are recorded under the lock, in order;
+    snapshots are written after it is released, so reads don't wait
+    for the file. Each process has its own copy.
+    """
+
+    def __init__(self):
+        """ Initialize the lock
+        """
+        self.lock = threading.RLock()
+
+    def load(self, cls: type, lazy: bool = None):
+        """ Load all objects of cls from file
+        The snapshot is loaded first, then the change log is replayed.
+        A snapshot in another format than DB_FORMAT is migrated.
+        With lazy (LAZY_LOAD by default) objects are only built when
+        first accessed.
+        """
+        s_class = cls.__name__
+        with self.lock:
+            DATA[s_class] = {}
+            INDEXES.pop(s_class, None)
+            SORTED_INDEXES.pop(s_class, None)
+            SCAN_INDEXES.pop(s_class, None)
+            serializer, file_path, migrate = snapshot_source(s_class)
+            if path.exists(file_path):
+                # A file to migrate may predate checksums
+                with open_checked(file_path, serializer.binary,
+                                  CHECKSUM and not migrate) as f:
+                    objs_json = serializer.load(f)
+                    if LAZY_LOAD if lazy is None else lazy:
+                        DATA[s_class] = LazyObjects(cls, dict(objs_json))
+                    else:
+                        for obj_id, obj_json in objs_json:
+                            DATA[s_class][obj_id] = cls(**obj_json)
+
+            if path.exists(file_path):
+                FILE_SIZES[file_path] = path.getsize(file_path)
+            # Replayed entries count towards COMPACT_THRESHOLD, so a
+            # process restarted often still compacts the log
+            entries = 0
+            for log_path in log_paths(s_class):
+                FILE_SIZES[log_path] = path.getsize(log_path)
+                entries += cls.replay_log(log_path)
+            with cls.log()['lock']:
+                cls.log()['entries'] = entries
+        # save_to_file takes the lock itself
+        if migrate:
+            cls.save_to_file()
+            os.replace(file_path, file_path + ".migrated")
+            FILE_SIZES.pop(file_path, None)
+
+    def save(self, obj: Base):
+        """ Store obj, update the indexes and persist the change
+        """
+        s_class = obj.__class__.__name__
+        with self.lock:
+            indexes = list(obj.__class__.indexes().values()) + \
+                list(obj.__class__.sorted_indexes().values()) + \
+                list(SCAN_INDEXES.get(s_class, {}).values())
+            for index in indexes:
+                index.check(obj)
+            DATA[s_class][obj.id] = obj
+            for index in indexes:
+                index.add(obj)
+            if PERSISTENCE != "snapshot":
+                obj.persist()
+        if PERSISTENCE == "snapshot":
+            obj.persist()
+
+    def remove(self, obj: Base):
+        """ Drop obj, update the indexes and persist the change
+        """
+        s_class = obj.__class__.__name__
+        with self.lock:
+            if obj.id not in DATA[s_class]:
+                return
+            del DATA[s_class][obj.id]
+            for index in obj.__class__.indexes().values():
+                index.discard(obj.id)
+            for index in obj.__class__.sorted_indexes().values():
+                index.discard(obj.id)
+            for index in SCAN_INDEXES.get(s_class, {}).values():
+                index.discard(obj.id)
+            if PERSISTENCE != "snapshot":
+                obj.persist(removed=True)
+        if PERSISTENCE == "snapshot":
+            obj.persist(removed=True)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of cls
+        """
+        return len(DATA.get(cls.__name__, ()))
+
+    def counts(self) -> dict:
+        """ Count the objects of every loaded class
+        """
+        with self.lock:
+            return {s_class: len(objs) for s_class, objs in DATA.items()}
+
+    def file_sizes(self) -> dict:
+        """ Return the size of each .db_<Class> file written or read
+        """
+        return dict(FILE_SIZES)
+
+    def get(self, cls: type, id: str) -> Base:
+        """ Return one object of cls by ID
+        """
+        s_class = cls.__name__
+        with self.lock:
+            return DATA[s_class].get(id)
+
+    def search(self, cls: type, attributes: dict = {}) -> List[Base]:
+        """ Search all objects of cls with matching attributes
+        Equality on an indexed attribute is looked up in its index,
+        the other attributes are checked on the matching objects only.
+        """
         s_class = cls.__name__
         def _search(obj):
             if len(attributes) == 0:
@@ -133,5 +1025,69 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        with self.lock:
+            objs = None
+            indexes = cls.indexes()
+            for k, v in attributes.items():
+                if k in indexes:
+                    try:
+                        objs = indexes[k].get(v)
+                    except TypeError:
+                        continue
+                    break
+            if objs is None:
+                objs = DATA[s_class].values()
+            return list(filter(_search, objs))
+
+    def scan(self, cls: type, order_by: str, after: str = None,
+             limit: int = None) -> Iterator[Base]:
+        """ Iterate over objects of cls in the order_by order
+        The page is read from the scan index of order_by, starting at
+        the cursor, so it costs limit objects whatever the class size
+        """
+        with self.lock:
+            objs = cls.scan_index(order_by).after(after)
+            return iter(list(islice(objs, limit)))
+
+    def query(self, cls: type, q: Query) -> Union[List[Base], int]:
+        """ Run a Base.query over objects of cls
+        Candidates come from an equality index, else from a sorted
+        index range, else from the sorted index of order_by; when they
+        are already in order the scan stops after limit matches.
+        """
+        s_class = cls.__name__
+        with self.lock:
+            indexes = cls.indexes()
+            sorted_indexes = cls.sorted_indexes()
+            objs, ordered = None, q.order_by is None
+            for k, v in q.where.items():
+                if k in indexes:
+                    try:
+                        objs = indexes[k].get(v)
+                    except TypeError:
+                        continue
+                    break
+            ranges = [(k, index.range(*q.between[k], q.descending))
+                      for k, index in sorted_indexes.items()
+                      if k in q.between]
+            ranges += [(k, index.prefix(q.prefix[k], q.descending))
+                       for k, index in sorted_indexes.items()
+                       if k in q.prefix]
+            if objs is None and len(ranges) > 0:
+                k, objs = ranges[0]
+                ordered = ordered or k == q.order_by
+            if objs is None and q.order_by in sorted_indexes:
+                objs = sorted_indexes[q.order_by].ordered(q.descending)
+                ordered = True
+            if objs is None:
+                objs = DATA[s_class].values()
+            matches = filter(q.match, objs)
+            if q.count_only:
+                return sum(1 for _ in matches)
+            if ordered:
+                return list(islice(matches, q.limit))
+            if q.limit is None:
+                return sorted(matches, key=q.key, reverse=q.descending)
+            pick = heapq.nlargest if q.descending else heapq.nsmallest
+            return pick(q.limit, matches, key=q.key)
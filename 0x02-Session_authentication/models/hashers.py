@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+""" Password hashers of User, and the pool verifying passwords
+"""
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+
+class SHA256Hasher():
+    """ Legacy unsalted SHA-256, stored as 64 hex digits
+    Only kept to verify hashes made before the KDFs
+    """
+
+    name = "sha256"
+
+    def hash(self, pwd: str) -> str:
+        """ Hash a password
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Check a password against a hash
+        """
+        return hmac.compare_digest(self.hash(pwd).encode(), hashed.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Legacy hashes are always replaced
+        """
+        return True
+
+
+class PBKDF2Hasher():
+    """ Salted PBKDF2-HMAC-SHA256
+    Stored as pbkdf2_sha256$<iterations>$<salt>$<hash>
+    """
+
+    name = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int = 260000):
+        """ Initialize the hasher with its cost
+        """
+        self.iterations = iterations
+
+    def derive(self, pwd: str, salt: bytes, iterations: int) -> str:
+        """ Return the base64 key derived from pwd
+        """
+        key = hashlib.pbkdf2_hmac('sha256', pwd.encode(), salt, iterations)
+        return base64.b64encode(key).decode()
+
+    def hash(self, pwd: str) -> str:
+        """ Hash a password with a new salt
+        """
+        salt = os.urandom(16)
+        return "{}${}${}${}".format(
+            self.name, self.iterations, base64.b64encode(salt).decode(),
+            self.derive(pwd, salt, self.iterations))
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Check a password against a hash
+        """
+        _, iterations, salt, key = hashed.split("$")
+        derived = self.derive(pwd, base64.b64decode(salt), int(iterations))
+        return hmac.compare_digest(derived.encode(), key.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Tell if the hash was made with another cost
+        """
+        return int(hashed.split("$")[1]) != self.iterations
+
+
+class ScryptHasher():
+    """ Salted scrypt
+    Stored as scrypt$<n>$<r>$<p>$<salt>$<hash>
+    """
+
+    name = "scrypt"
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        """ Initialize the hasher with its cost
+        """
+        self.params = (n, r, p)
+
+    def derive(self, pwd: str, salt: bytes, n: int, r: int, p: int) -> str:
+        """ Return the base64 key derived from pwd
+        """
+        key = hashlib.scrypt(pwd.encode(), salt=salt, n=n, r=r, p=p,
+                             maxmem=256 * n * r + 1024 * 1024)
+        return base64.b64encode(key).decode()
+
+    def hash(self, pwd: str) -> str:
+        """ Hash a password with a new salt
+        """
+        salt = os.urandom(16)
+        return "{}${}${}${}${}${}".format(
+            self.name, *self.params, base64.b64encode(salt).decode(),
+            self.derive(pwd, salt, *self.params))
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Check a password against a hash
+        """
+        _, n, r, p, salt, key = hashed.split("$")
+        derived = self.derive(pwd, base64.b64decode(salt),
+                              int(n), int(r), int(p))
+        return hmac.compare_digest(derived.encode(), key.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Tell if the hash was made with other parameters
+        """
+        return tuple(map(int, hashed.split("$")[1:4])) != self.params
+
+
+HASHERS = {
+    'sha256': SHA256Hasher(),
+    'pbkdf2_sha256': PBKDF2Hasher(
+        int(getenv("PBKDF2_ITERATIONS", "260000"))),
+    'scrypt': ScryptHasher(int(getenv("SCRYPT_N", str(2 ** 14)))),
+}
+# Hasher of new passwords
+PASSWORD_HASHER = getenv("PASSWORD_HASHER", "pbkdf2_sha256")
+
+
+def identify(hashed: str):
+    """ Return the hasher that made hashed
+    """
+    if "$" not in hashed:
+        return HASHERS['sha256']
+    return HASHERS[hashed.split("$", 1)[0]]
+
+
+def needs_rehash(hashed: str) -> bool:
+    """ Tell if hashed should be replaced by a PASSWORD_HASHER hash
+    """
+    hasher = identify(hashed)
+    return hasher.name != PASSWORD_HASHER or hasher.needs_rehash(hashed)
+
+
+class VerifyPool():
+    """ Worker threads running the hashers
+    hashlib releases the GIL while deriving keys, so up to workers
+    hashes run in parallel. At most max_pending calls may wait for or
+    use the pool; past that, callers wait up to timeout for a slot, so
+    a login flood queues here instead of taking every request thread.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None,
+                 timeout: float = 5.0):
+        """ Start the pool
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix="password")
+        self.slots = threading.BoundedSemaphore(
+            max_pending or 4 * self.workers)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        """ Run fn(*args) on the pool and return its result
+        Raises TimeoutError if no slot frees up within timeout
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError("too many password checks pending")
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, pwd: str) -> str:
+        """ Hash a password with PASSWORD_HASHER
+        """
+        return self.run(HASHERS[PASSWORD_HASHER].hash, pwd)
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Check a password against a hash made by any hasher
+        """
+        return self.run(identify(hashed).verify, pwd, hashed)
+
+
+POOL = {}
+POOL_LOCK = threading.Lock()
+
+
+def pool() -> VerifyPool:
+    """ Return the shared pool, sized by PASSWORD_WORKERS,
+    PASSWORD_MAX_PENDING and PASSWORD_TIMEOUT
+    """
+    with POOL_LOCK:
+        if POOL.get('pool') is None:
+            POOL['pool'] = VerifyPool(
+                int(getenv("PASSWORD_WORKERS", "0")),
+                int(getenv("PASSWORD_MAX_PENDING", "0")),
+                float(getenv("PASSWORD_TIMEOUT", "5")))
+        return POOL['pool']
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+""" Serializers of the .db_<Class> snapshot files
+"""
+from itertools import accumulate
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+import json
+import struct
+
+
+class JSONSerializer():
+    """ One JSON object mapping each id to its object
+    """
+
+    extension = "json"
+    binary = False
+
+    def dump(self, objs_json: Dict[str, dict], f):
+        """ Write all objects
+        """
+        json.dump(objs_json, f)
+
+    def load(self, f) -> Iterator[Tuple[str, dict]]:
+        """ Read all (id, object) pairs
+        """
+        return iter(json.load(f).items())
+
+
+class BinarySerializer():
+    """ Header with the attribute names, then the objects by columns
+
+    Layout: MAGIC, then blocks of a 4-byte size and as many bytes. The
+    first block is the list of attribute names, as an L value. The next
+    ones are a 4-byte count n of objects, up to BLOCK_SIZE, and a column
+    per attribute:
+      - n tags, one per object
+      - a 4-byte length in characters per S tag, then a 4-byte size
+        and the UTF-8 text of these strings put together
+      - a 4-byte size and the values of the other tags but N and M,
+        each a tag and its payload
+    Tags and payloads:
+      - N, T, F: None, True, False
+      - I: 8-byte signed integer; B: a bigger one as S payload text
+      - D: 8-byte double
+      - S: string; 4-byte size then UTF-8 text inside L and O
+      - L: 4-byte count then the items; O: 4-byte count then key (S
+        payload) and value pairs
+      - M: attribute the object does not have
+    Numbers are little-endian. A column of strings is decoded at once
+    and blocks are read one at a time, so memory stays bounded by one.
+    """
+
+    extension = "bin"
+    binary = True
+    MAGIC = b"HBDB\x02"
+    BLOCK_SIZE = 1024
+    LENGTH = struct.Struct("<I")
+    INT = struct.Struct("<q")
+    FLOAT = struct.Struct("<d")
+    INT_RANGE = range(-2 ** 63, 2 ** 63)
+    MISSING = object()
+    NONE, TRUE, FALSE, INT_TAG, BIG, FLOAT_TAG, STR, LIST, OBJECT, \
+        MISSING_TAG = b"NTFIBDSLOM"
+
+    def text(self, value: str) -> bytes:
+        """ Return the S payload of value
+        """
+        data = value.encode("utf-8", "surrogatepass")
+        return self.LENGTH.pack(len(data)) + data
+
+    def encode(self, value, out: List[bytes]):
+        """ Append the tag and payload of value to out
+        """
+        if value is None:
+            out.append(b"N")
+        elif value is True:
+            out.append(b"T")
+        elif value is False:
+            out.append(b"F")
+        elif isinstance(value, str):
+            out.append(b"S" + self.text(value))
+        elif isinstance(value, int):
+            if value in self.INT_RANGE:
+                out.append(b"I" + self.INT.pack(value))
+            else:
+                out.append(b"B" + self.text(str(value)))
+        elif isinstance(value, float):
+            out.append(b"D" + self.FLOAT.pack(value))
+        elif isinstance(value, (list, tuple)):
+            out.append(b"L" + self.LENGTH.pack(len(value)))
+            for item in value:
+                self.encode(item, out)
+        elif isinstance(value, dict):
+            out.append(b"O" + self.LENGTH.pack(len(value)))
+            for k, v in value.items():
+                out.append(self.text(k))
+                self.encode(v, out)
+        else:
+            raise TypeError("can't serialize {}".format(
+                type(value).__name__))
+
+    def decode_text(self, data: bytes, offset: int) -> Tuple[str, int]:
+        """ Read the S payload at offset, return it and the next offset
+        """
+        end = offset + 4 + self.LENGTH.unpack_from(data, offset)[0]
+        return data[offset + 4:end].decode("utf-8", "surrogatepass"), end
+
+    def decode(self, data: bytes, offset: int) -> Tuple[object, int]:
+        """ Read the value at offset, return it and the next offset
+        """
+        tag = data[offset]
+        offset += 1
+        if tag == self.STR:
+            return self.decode_text(data, offset)
+        if tag == self.NONE:
+            return None, offset
+        if tag == self.INT_TAG:
+            return self.INT.unpack_from(data, offset)[0], offset + 8
+        if tag == self.TRUE or tag == self.FALSE:
+            return tag == self.TRUE, offset
+        if tag == self.FLOAT_TAG:
+            return self.FLOAT.unpack_from(data, offset)[0], offset + 8
+        if tag == self.BIG:
+            value, offset = self.decode_text(data, offset)
+            return int(value), offset
+        if tag == self.LIST or tag == self.OBJECT:
+            count = self.LENGTH.unpack_from(data, offset)[0]
+            offset += 4
+        if tag == self.LIST:
+            items = []
+            for _ in range(count):
+                item, offset = self.decode(data, offset)
+                items.append(item)
+            return items, offset
+        if tag == self.OBJECT:
+            obj = {}
+            for _ in range(count):
+                k, offset = self.decode_text(data, offset)
+                obj[k], offset = self.decode(data, offset)
+            return obj, offset
+        raise ValueError("unknown tag {!r}".format(chr(tag)))
+
+    def dump_column(self, values: list, out: List[bytes]):
+        """ Append the column of values to out
+        """
+        tags, lengths, strings, others = bytearray(), [], [], []
+        for value in values:
+            if value is None:
+                tags.append(self.NONE)
+            elif value is self.MISSING:
+                tags.append(self.MISSING_TAG)
+            elif isinstance(value, str):
+                tags.append(self.STR)
+                lengths.append(len(value))
+                strings.append(value)
+            else:
+                start = len(others)
+                self.encode(value, others)
+                tags.append(others[start][0])
+        text = "".join(strings).encode("utf-8", "surrogatepass")
+        others = b"".join(others)
+        out += [bytes(tags), struct.pack("<{}I".format(len(lengths)),
+                                         *lengths),
+                self.LENGTH.pack(len(text)), text,
+                self.LENGTH.pack(len(others)), others]
+
+    def load_column(self, data: bytes, offset: int,
+                    n: int) -> Tuple[list, int]:
+        """ Read the column of n values at offset, return it and the
+        next offset
+        """
+        length = self.LENGTH.unpack_from
+        tags = data[offset:offset + n]
+        offset += n
+        count = tags.count(self.STR)
+        lengths = struct.unpack_from("<{}I".format(count), data, offset)
+        offset += 4 * count
+        size = length(data, offset)[0]
+        text = data[offset + 4:offset + 4 + size].decode(
+            "utf-8", "surrogatepass")
+        offset += 4 + size
+        ends = list(accumulate(lengths))
+        strings = [text[start:end]
+                   for start, end in zip([0] + ends, ends)]
+        end = offset + 4 + length(data, offset)[0]
+        if count == n:
+            return strings, end
+        values, strings, offset = [], iter(strings), offset + 4
+        for tag in tags:
+            if tag == self.STR:
+                values.append(next(strings))
+            elif tag == self.NONE:
+                values.append(None)
+            elif tag == self.MISSING_TAG:
+                values.append(self.MISSING)
+            else:
+                value, offset = self.decode(data, offset)
+                values.append(value)
+        return values, end
+
+    def write_block(self, out: List[bytes], f: BinaryIO):
+        """ Write one length-prefixed block
+        """
+        data = b"".join(out)
+        f.write(self.LENGTH.pack(len(data)))
+        f.write(data)
+
+    def read_block(self, f: BinaryIO) -> bytes:
+        """ Read one block, None at the end of the file
+        """
+        prefix = f.read(self.LENGTH.size)
+        if len(prefix) == 0:
+            return None
+        data = b""
+        if len(prefix) == self.LENGTH.size:
+            size = self.LENGTH.unpack(prefix)[0]
+            data = f.read(size)
+        if len(prefix) < self.LENGTH.size or len(data) < size:
+            raise ValueError("truncated {} file".format(self.extension))
+        return data
+
+    def dump(self, objs_json: Dict[str, dict], f: BinaryIO):
+        """ Write all objects
+        """
+        keys = {}
+        for obj_json in objs_json.values():
+            keys.update(dict.fromkeys(obj_json))
+        keys = list(keys)
+        f.write(self.MAGIC)
+        header = []
+        self.encode(keys, header)
+        self.write_block(header, f)
+        objs = list(objs_json.values())
+        for i in range(0, len(objs), self.BLOCK_SIZE):
+            block = objs[i:i + self.BLOCK_SIZE]
+            out = [self.LENGTH.pack(len(block))]
+            for k in keys:
+                self.dump_column(
+                    [obj_json.get(k, self.MISSING) for obj_json in block],
+                    out)
+            self.write_block(out, f)
+
+    def load(self, f: BinaryIO) -> Iterator[Tuple[str, dict]]:
+        """ Read all (id, object) pairs
+        """
+        if f.read(len(self.MAGIC)) != self.MAGIC:
+            raise ValueError("not a {} file of this version".format(
+                self.extension))
+        header = self.read_block(f)
+        if header is None:
+            raise ValueError("truncated {} file".format(self.extension))
+        keys, _ = self.decode(header, 0)
+        block = self.read_block(f)
+        while block is not None:
+            n, offset, columns = self.LENGTH.unpack_from(block)[0], 4, []
+            for _ in keys:
+                column, offset = self.load_column(block, offset, n)
+                columns.append(column)
+            missing = any(self.MISSING in column for column in columns)
+            for values in zip(*columns):
+                obj_json = dict(zip(keys, values))
+                if missing and self.MISSING in values:
+                    obj_json = {k: v for k, v in obj_json.items()
+                                if v is not self.MISSING}
+                yield obj_json.get('id'), obj_json
+            block = self.read_block(f)
+
+
+SERIALIZERS = {
+    'json': JSONSerializer(),
+    'binary': BinarySerializer(),
+}
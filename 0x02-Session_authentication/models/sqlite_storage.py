@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+""" SQLite storage backend shared by several processes
+"""
+from typing import Iterator, List, TypeVar, Union
+from datetime import datetime
+from itertools import islice
+from os import path
+import json
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ Objects of every class in one SQLite table, in WAL mode
+
+    Every process and thread opens its own connection to the same
+    file, so all gunicorn workers see one consistent set of objects.
+    Attributes declared in INDEXES, UNIQUE_INDEXES and SORTED_INDEXES
+    get an index on their JSON value. Triggers keep the number of
+    objects of each class in the counts table.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS objects ("
+        "class TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+        "PRIMARY KEY (class, id))"
+    )
+    # Classes whose file store was imported, so it is never read again
+    IMPORTS = "CREATE TABLE IF NOT EXISTS imports (class TEXT PRIMARY KEY)"
+    COUNTS = (
+        "CREATE TABLE counts (class TEXT PRIMARY KEY, n INTEGER NOT NULL)",
+        "INSERT INTO counts SELECT class, COUNT(*) FROM objects "
+        "GROUP BY class",
+        "CREATE TRIGGER count_insert AFTER INSERT ON objects BEGIN "
+        "INSERT OR IGNORE INTO counts VALUES (new.class, 0); "
+        "UPDATE counts SET n = n + 1 WHERE class = new.class; END",
+        "CREATE TRIGGER count_delete AFTER DELETE ON objects BEGIN "
+        "UPDATE counts SET n = n - 1 WHERE class = old.class; END",
+    )
+    # Values SQLite compares the same way Python does
+    SQL_TYPES = (str, int, float)
+
+    def __init__(self, file_path: str):
+        """ Initialize the backend over file_path
+        """
+        self.file_path = file_path
+        self.local = threading.local()
+        self.ready = set()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread and process
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.file_path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self.SCHEMA)
+            conn.execute(self.IMPORTS)
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("SELECT 1 FROM sqlite_master "
+                                "WHERE name = 'counts'").fetchone() is None:
+                    for statement in self.COUNTS:
+                        conn.execute(statement)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return self.local.conn
+
+    def prepare(self, cls: type):
+        """ Create the indexes declared by cls
+        """
+        if cls.__name__ in self.ready:
+            return
+        conn = self.connection()
+        for attr in cls.INDEXES + cls.UNIQUE_INDEXES + cls.SORTED_INDEXES:
+            unique = "UNIQUE " if attr in cls.UNIQUE_INDEXES else ""
+            # The same expression as in search, so the planner uses it
+            conn.execute(
+                "CREATE {}INDEX IF NOT EXISTS \"{}_{}\" ON objects "
+                "(class, json_extract(data, '$.{}'))".format(
+                    unique, cls.__name__, attr, attr))
+        self.ready.add(cls.__name__)
+
+    def imported(self, cls: type) -> bool:
+        """ Tell if the file store of cls was imported
+        """
+        return self.connection().execute(
+            "SELECT 1 FROM imports WHERE class = ?",
+            (cls.__name__,)).fetchone() is not None
+
+    def load(self, cls: type, lazy: bool = None):
+        """ Import the file store of cls once, recorded in imports
+        The snapshot and change log are read like MemoryStorage.load
+        reads them: DB_FORMAT or another format, checksum, then log.
+        Rows already there (a database older than the imports table)
+        are kept and the import only recorded.
+        """
+        # Imported here: models.base imports this module
+        from models.base import (CHECKSUM, log_entries, log_paths,
+                                 open_checked, snapshot_source)
+        s_class = cls.__name__
+        self.prepare(cls)
+        if self.imported(cls):
+            return
+        serializer, file_path, migrate = snapshot_source(s_class)
+        objs_json = {}
+        if path.exists(file_path):
+            with open_checked(file_path, serializer.binary,
+                              CHECKSUM and not migrate) as f:
+                objs_json.update(serializer.load(f))
+        for log_path in log_paths(s_class):
+            for obj_id, obj_json in log_entries(log_path):
+                if obj_json is None:
+                    objs_json.pop(obj_id, None)
+                else:
+                    objs_json[obj_id] = obj_json
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have imported it since the check
+            if self.imported(cls):
+                return
+            if self.count(cls) == 0:
+                conn.executemany(
+                    "INSERT INTO objects VALUES (?, ?, ?)",
+                    ((s_class, obj_id, json.dumps(obj_json))
+                     for obj_id, obj_json in objs_json.items()))
+            conn.execute("INSERT INTO imports VALUES (?)", (s_class,))
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update obj
+        Raises ValueError if obj would break a unique index
+        """
+        self.prepare(obj.__class__)
+        try:
+            self.connection().execute(
+                "INSERT INTO objects VALUES (?, ?, ?) "
+                "ON CONFLICT (class, id) DO UPDATE SET data = excluded.data",
+                (obj.__class__.__name__, obj.id,
+                 json.dumps(obj.to_json(True))))
+        except sqlite3.IntegrityError as e:
+            raise ValueError(str(e))
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete obj
+        """
+        self.connection().execute(
+            "DELETE FROM objects WHERE class = ? AND id = ?",
+            (obj.__class__.__name__, obj.id))
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of cls
+        """
+        row = self.connection().execute(
+            "SELECT n FROM counts WHERE class = ?",
+            (cls.__name__,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def counts(self) -> dict:
+        """ Count the objects of every class
+        """
+        return dict(self.connection().execute(
+            "SELECT class, n FROM counts WHERE n > 0"))
+
+    def file_sizes(self) -> dict:
+        """ Return the size of the database file and of its WAL
+        """
+        conn = self.connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        sizes = {self.file_path: page_size * pages}
+        wal_path = self.file_path + "-wal"
+        if path.exists(wal_path):
+            sizes[wal_path] = path.getsize(wal_path)
+        return sizes
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object of cls by ID
+        """
+        row = self.connection().execute(
+            "SELECT data FROM objects WHERE class = ? AND id = ?",
+            (cls.__name__, id)).fetchone()
+        return None if row is None else cls(**json.loads(row[0]))
+
+    def search(self, cls: type,
+               attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects of cls with matching attributes
+        Plain values are matched in SQL, then every attribute is
+        checked on the objects like the in-memory search does.
+        """
+        self.prepare(cls)
+        query = "SELECT data FROM objects WHERE class = ?"
+        params = [cls.__name__]
+        for k, v in attributes.items():
+            if not k.isidentifier():
+                continue
+            # The path is inlined so the declared indexes can be used
+            if v is None:
+                query += " AND json_extract(data, '$.{}') IS NULL".format(k)
+            elif type(v) in self.SQL_TYPES:
+                query += " AND json_extract(data, '$.{}') = ?".format(k)
+                params.append(v)
+        rows = self.connection().execute(query + " ORDER BY rowid", params)
+        objs = [cls(**json.loads(row[0])) for row in rows]
+        return [obj for obj in objs
+                if all(getattr(obj, k) == v for k, v in attributes.items())]
+
+    def scan(self, cls: type, order_by: str, after: str = None,
+             limit: int = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate over objects of cls in the order_by order
+        Rows are read from the cursor as they are consumed
+        """
+        key = "id"
+        if order_by != 'id':
+            key = "json_extract(data, '$.{}') || ' ' || id".format(order_by)
+        query = "SELECT data FROM objects WHERE class = ?"
+        params = [cls.__name__]
+        if after is not None:
+            query += " AND {} > ?".format(key)
+            params.append(after)
+        query += " ORDER BY {}".format(key)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in self.connection().execute(query, params):
+            yield cls(**json.loads(row[0]))
+
+    def sql_value(self, value):
+        """ Return value as stored in the JSON data, None if SQLite
+        can't compare it the way Python does
+        """
+        if isinstance(value, datetime):
+            return value.isoformat(timespec='seconds')
+        return value if type(value) in self.SQL_TYPES else None
+
+    def query(self, cls: type, q) -> Union[List[TypeVar('Base')], int]:
+        """ Run a Base.query over objects of cls
+        Predicates are translated to SQL where possible; LIMIT and
+        COUNT(*) are only pushed down when all of them were, otherwise
+        the rows are checked with q.match first.
+        """
+        self.prepare(cls)
+        query = "SELECT {} FROM objects WHERE class = ?"
+        params = [cls.__name__]
+        # Stays True while the SQL conditions are exactly q.match
+        exact = True
+        conditions = [(k, "=", v) for k, v in q.where.items()]
+        for k, (low, high) in q.between.items():
+            conditions += [(k, ">=", low), (k, "<=", high)]
+        for k, v in q.prefix.items():
+            conditions += [(k, ">=", v), (k, "<", v + chr(0x10ffff))]
+        for k, op, v in conditions:
+            if not k.isidentifier():
+                exact = False
+                continue
+            # The path is inlined so the declared indexes can be used
+            expr = "json_extract(data, '$.{}')".format(k)
+            if v is None:
+                query += " AND {} IS {}NULL".format(
+                    expr, "" if op == "=" else "NOT ")
+            elif self.sql_value(v) is None:
+                exact = False
+            else:
+                query += " AND {} {} ?".format(expr, op)
+                params.append(self.sql_value(v))
+                if isinstance(v, datetime) and v.microsecond != 0:
+                    exact = False
+        if q.order_by is not None:
+            if not q.order_by.isidentifier():
+                raise ValueError("invalid order_by {}".format(q.order_by))
+            expr = "json_extract(data, '$.{}')".format(q.order_by)
+            direction = " DESC" if q.descending else ""
+            query += " ORDER BY {0} IS NULL{1}, {0}{1}, id{1}".format(
+                expr, direction)
+        if exact and q.count_only:
+            return self.connection().execute(
+                query.format("COUNT(*)"), params).fetchone()[0]
+        if exact and q.limit is not None:
+            query += " LIMIT ?"
+            params.append(q.limit)
+        rows = self.connection().execute(query.format("data"), params)
+        objs = (cls(**json.loads(row[0])) for row in rows)
+        if not exact:
+            objs = filter(q.match, objs)
+        if q.count_only:
+            return sum(1 for _ in objs)
+        return list(islice(objs, q.limit))
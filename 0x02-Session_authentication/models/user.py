@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from models import hashers
 from models.base import Base
 
 
@@ -9,6 +9,10 @@ class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    INDEXES = ('email',)
+    SORTED_INDEXES = ('email', 'created_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +30,34 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash with PASSWORD_HASHER
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hashers.pool().hash(pwd)
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+        The check runs on the password pool; False if the hash is
+        malformed. Raises TimeoutError if the pool is too busy, so
+        callers can answer 503 rather than reject the password.
+        A valid password hashed by an older hasher or cost (like the
+        legacy SHA256) is hashed again and the User saved.
         """
         if pwd is None or type(pwd) is not str:
             return False
         if self.password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        try:
+            if not hashers.pool().verify(pwd, self.password):
+                return False
+        except (KeyError, ValueError):
+            return False
+        if hashers.needs_rehash(self.password):
+            self.password = pwd
+            self.save()
+        return True
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -8,6 +8,10 @@ class UserSession(Base):
     """Represents a user session.
     """
 
+    __slots__ = ('user_id', 'session_id')
+    INDEXES = ('user_id',)
+    UNIQUE_INDEXES = ('session_id',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a UserSession instance.
         """
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" parse_authorization_header against the step methods of BasicAuth
+"""
+import base64
+import os
+import random
+import sys
+import timeit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("flask")
+
+from api.v1.auth.basic_auth import BasicAuth  # noqa: E402
+
+CREDENTIAL_CHARS = "ab:@. \t\n\r\x0béz"
+BASE64_CHARS = "QUJj+/=09 \t"
+
+
+def step_by_step(auth: BasicAuth, header) -> tuple:
+    """ Credentials of header, parsed by the three step methods
+    """
+    token = auth.extract_base64_authorization_header(header)
+    decoded = auth.decode_base64_authorization_header(token)
+    return auth.extract_user_credentials(decoded)
+
+
+def random_header(rng: random.Random) -> str:
+    """ A mostly well-formed ASCII Basic Authorization header
+    """
+    if rng.random() < 0.7:
+        user, password = ("".join(rng.choice(CREDENTIAL_CHARS)
+                                  for _ in range(rng.randrange(6)))
+                          for _ in range(2))
+        raw = "{}{}{}".format(user, rng.choice(":::;"), password).encode()
+        if rng.random() < 0.1:
+            raw += b"\xff"
+        token = base64.b64encode(raw).decode()
+        if rng.random() < 0.2:
+            token = token.rstrip("=")
+    else:
+        token = "".join(rng.choice(BASE64_CHARS)
+                        for _ in range(rng.randrange(10)))
+    scheme = "Basic "
+    if rng.random() < 0.3:
+        scheme = rng.choice(("Basic  ", "basic ", "Basic", "Bearer ", ""))
+    padding = ("", " ", "\t", "\n")
+    return rng.choice(padding) + scheme + token + rng.choice(padding)
+
+
+def test_same_result_as_the_steps():
+    """ Random headers give the same credentials both ways
+    """
+    rng = random.Random(0)
+    auth = BasicAuth()
+    for _ in range(50000):
+        header = random_header(rng)
+        assert auth.parse_authorization_header(header) == \
+            step_by_step(auth, header), repr(header)
+    for header in (None, 42, "", "Basic", "Basic é"):
+        assert auth.parse_authorization_header(header) == (None, None)
+
+
+def test_faster_than_the_steps():
+    """ Benchmark on a valid header
+    """
+    auth = BasicAuth()
+    header = "Basic " + base64.b64encode(b"bob@hbtn.io:H0lbertonSchool98!")\
+        .decode()
+    assert auth.parse_authorization_header(header) == \
+        step_by_step(auth, header) == ("bob@hbtn.io", "H0lbertonSchool98!")
+    times = {}
+    for name, parse in (("steps", lambda: step_by_step(auth, header)),
+                        ("one pass", lambda: auth.parse_authorization_header(
+                            header))):
+        times[name] = min(timeit.repeat(parse, number=2000, repeat=5)) / 2000
+    print("steps {:.2f}us, one pass {:.2f}us".format(
+        times["steps"] * 1e6, times["one pass"] * 1e6))
+    assert times["one pass"] < times["steps"]
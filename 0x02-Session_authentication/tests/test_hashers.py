@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+""" Password hashing tests of User
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models import hashers  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+@pytest.fixture
+def user(monkeypatch, tmp_path):
+    """ A stored User, with cheap KDF costs
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    monkeypatch.setitem(hashers.HASHERS, "pbkdf2_sha256",
+                        hashers.PBKDF2Hasher(1000))
+    monkeypatch.setattr(hashers, "PASSWORD_HASHER", "pbkdf2_sha256")
+    User.load_from_file()
+    user = User(email="a@b")
+    user.save()
+    return user
+
+
+def test_legacy_hash_is_upgraded(user):
+    """ A valid legacy SHA256 password is rehashed with the KDF
+    """
+    user._password = hashlib.sha256(b"pwd").hexdigest()
+    assert not user.is_valid_password("other")
+    assert user.is_valid_password("pwd")
+    assert user.password.startswith("pbkdf2_sha256$1000$")
+    assert User.get(user.id).password == user.password
+    assert user.is_valid_password("pwd")
+
+
+@pytest.mark.parametrize("stored", [
+    "é" * 64, "pbkdf2_sha256$1000$c2FsdA==$é", "x$y", "sha$",
+])
+def test_malformed_hash_is_invalid(user, stored):
+    """ Malformed or non-ASCII stored hashes never validate
+    """
+    user._password = stored
+    assert not user.is_valid_password("pwd")
+
+
+def test_busy_pool_raises(user, monkeypatch):
+    """ Pool saturation is not reported as a wrong password
+    """
+    pool = hashers.VerifyPool(1, 1, 0.01)
+    monkeypatch.setitem(hashers.POOL, "pool", pool)
+    user.password = "pwd"
+    busy = threading.Thread(target=pool.run, args=(time.sleep, 0.3))
+    busy.start()
+    time.sleep(0.05)
+    with pytest.raises(TimeoutError):
+        user.is_valid_password("pwd")
+    busy.join()
+    assert user.is_valid_password("pwd")
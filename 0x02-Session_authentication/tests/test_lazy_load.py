@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+""" Lazy loading tests: indexed lookups only build what they return
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def built() -> int:
+    """ Number of User objects built out of their JSON
+    """
+    return sum(1 for obj in dict.values(base.DATA['User'])
+               if type(obj) is not dict)
+
+
+def test_indexed_lookups_stay_lazy(monkeypatch, tmp_path):
+    """ search and query through an index build only their results
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    User.load_from_file(lazy=False)
+    for i in range(30):
+        User(email="u{:02d}@x".format(i)).save()
+    User.load_from_file(lazy=True)
+    assert built() == 0
+
+    assert [u.email for u in User.search({'email': 'u07@x'})] == ['u07@x']
+    assert built() == 1
+    users = User.query(prefix={'email': 'u1'}, order_by='email', limit=3)
+    assert [u.email for u in users] == ['u10@x', 'u11@x', 'u12@x']
+    assert built() == 4
+    assert User.count() == 30 and built() == 4
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" PathMatcher against the per-pattern require_auth loop it replaces
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("flask")
+
+from api.v1.auth.auth import Auth, PathMatcher  # noqa: E402
+
+SEGMENTS = ("api", "v1", "status", "stat", "users", "me", "a.b", "x")
+
+
+def require_auth_loop(path: str, excluded_paths: list) -> bool:
+    """ Auth.require_auth before PathMatcher
+    """
+    if path is not None and excluded_paths is not None:
+        for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+            pattern = ''
+            if exclusion_path[-1] == '*':
+                pattern = '{}.*'.format(exclusion_path[0:-1])
+            elif exclusion_path[-1] == '/':
+                pattern = '{}/*'.format(exclusion_path[0:-1])
+            else:
+                pattern = '{}/*'.format(exclusion_path)
+            if re.match(pattern, path):
+                return False
+    return True
+
+
+def random_path(rng: random.Random) -> str:
+    """ A path of a few SEGMENTS, maybe with a trailing slash
+    """
+    path = "/" + "/".join(rng.choice(SEGMENTS)
+                          for _ in range(rng.randrange(4)))
+    return path + rng.choice(("", "/", "//"))
+
+
+def random_pattern(rng: random.Random) -> str:
+    """ An exclusion path ending with '*', '/' or neither
+    """
+    pattern = random_path(rng).rstrip("/")
+    pattern += rng.choice(("", "/", "*", "/*"))
+    if pattern == "":
+        pattern = "*"
+    return rng.choice(("", " ")) + pattern + rng.choice(("", " "))
+
+
+def test_same_result_as_the_loop():
+    """ Random paths against random exclusion lists
+    """
+    rng = random.Random(0)
+    auth = Auth()
+    for _ in range(5000):
+        excluded = [random_pattern(rng) for _ in range(rng.randrange(6))]
+        matcher = PathMatcher(excluded)
+        for _ in range(5):
+            path = random_path(rng)
+            expected = require_auth_loop(path, excluded)
+            assert auth.require_auth(path, matcher) == expected, \
+                (path, excluded)
+            assert auth.require_auth(path, excluded) == expected
+    assert auth.require_auth(None, matcher)
+    assert auth.require_auth("/api", None)
+
+
+def test_faster_with_hundreds_of_patterns():
+    """ Benchmark: 500 exclusion patterns, a path matching none
+    """
+    excluded = ["/api/v1/excluded{}/".format(i) for i in range(500)]
+    excluded.append("/api/v1/status/*")
+    matcher = PathMatcher(excluded)
+    auth = Auth()
+    path = "/api/v1/users/me"
+    assert auth.require_auth(path, matcher)
+    assert require_auth_loop(path, excluded)
+    loop = min(timeit.repeat(lambda: require_auth_loop(path, excluded),
+                             number=20, repeat=3)) / 20
+    compiled = min(timeit.repeat(lambda: auth.require_auth(path, matcher),
+                                 number=2000, repeat=3)) / 2000
+    print("501 patterns: loop {:.1f}us, PathMatcher {:.1f}us".format(
+        loop * 1e6, compiled * 1e6))
+    assert compiled * 10 < loop
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+""" Crash and failure tests of the deferred and log persistence modes
+"""
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def run(cwd, script: str, crash: bool = False, **env: str) -> str:
+    """ Run script in a fresh interpreter and return its output
+    With crash, the script is expected to kill itself
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, PERSISTENCE="deferred", **env)
+    header = "from models.base import flush\n" \
+             "from models.user import User\n" \
+             "User.load_from_file()\n"
+    res = subprocess.run([sys.executable, "-c",
+                          header + textwrap.dedent(script)],
+                         cwd=str(cwd), env=env, capture_output=True,
+                         text=True)
+    assert res.returncode == (-9 if crash else 0), res.stderr
+    return res.stdout
+
+
+def count_users(cwd) -> int:
+    """ Number of users a new process loads from cwd
+    """
+    return int(run(cwd, "print(User.count())"))
+
+
+def test_crash_loses_only_unflushed_changes(tmp_path):
+    """ Changes made after the last flush are lost by a crash
+    """
+    run(tmp_path, """
+        import os, signal
+        for i in range(5):
+            User(email="flushed{}".format(i)).save()
+        flush()
+        for i in range(3):
+            User(email="lost{}".format(i)).save()
+        os.kill(os.getpid(), signal.SIGKILL)
+    """, crash=True, FLUSH_INTERVAL="60", FLUSH_BATCH="1000")
+    assert count_users(tmp_path) == 5
+
+
+def test_flusher_bounds_crash_loss(tmp_path):
+    """ Changes older than FLUSH_INTERVAL survive a crash
+    """
+    run(tmp_path, """
+        import os, signal, time
+        for i in range(3):
+            User(email="u{}".format(i)).save()
+        time.sleep(0.5)
+        os.kill(os.getpid(), signal.SIGKILL)
+    """, crash=True, FLUSH_INTERVAL="0.05")
+    assert count_users(tmp_path) == 3
+
+
+def failing_once(monkeypatch):
+    """ Make User.save_to_file raise OSError on its first call
+    """
+    save_to_file = User.save_to_file.__func__
+    calls = []
+
+    def save_once(cls):
+        calls.append(cls)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        save_to_file(cls)
+
+    monkeypatch.setattr(User, "save_to_file", classmethod(save_once))
+    return calls
+
+
+def setup_deferred(monkeypatch, tmp_path):
+    """ Empty User store in tmp_path, in deferred mode
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "deferred")
+    monkeypatch.setattr(base, "FLUSH_BATCH", 1000)
+    User.load_from_file()
+
+
+def test_failed_write_stays_dirty(monkeypatch, tmp_path):
+    """ A failed flush keeps the class dirty and raises
+    """
+    setup_deferred(monkeypatch, tmp_path)
+    calls = failing_once(monkeypatch)
+    User(email="a").save()
+    try:
+        base.flush()
+        assert False, "flush should raise"
+    except OSError:
+        pass
+    assert "User" in base.DIRTY
+    base.flush()
+    assert len(calls) == 2 and "User" not in base.DIRTY
+    assert count_users(tmp_path) == 1
+
+
+def test_flusher_survives_failed_write(monkeypatch, tmp_path):
+    """ The flusher thread logs a failed flush and retries it
+    """
+    setup_deferred(monkeypatch, tmp_path)
+    monkeypatch.setattr(base, "FLUSH_INTERVAL", 0.02)
+    calls = failing_once(monkeypatch)
+    thread = threading.Thread(target=base._flusher, daemon=True)
+    thread.start()
+    User(email="a").save()
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert thread.is_alive()
+    assert len(calls) >= 2 and "User" not in base.DIRTY
+    assert count_users(tmp_path) == 1
+
+
+def test_restarts_still_compact_the_log(monkeypatch, tmp_path):
+    """ Entries replayed at load count towards COMPACT_THRESHOLD
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "log")
+    monkeypatch.setattr(base, "COMPACT_THRESHOLD", 10)
+    for restart in range(5):
+        # A new process starts with no log state
+        monkeypatch.setattr(base, "LOGS", {})
+        User.load_from_file()
+        for i in range(6):
+            User(email="{}-{}".format(restart, i)).save()
+        while User.log()['compacting']:
+            time.sleep(0.01)
+    entries = 0
+    if os.path.exists(".db_User.log"):
+        with open(".db_User.log") as f:
+            entries = len(f.readlines())
+    assert entries < 10
+    User.load_from_file()
+    assert User.count() == 30
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" Tests of Base.scan pages on the in-memory storage
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models.base import sort_key  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def pages(order_by: str, limit: int) -> list:
+    """ Ids of every User, following the cursor page by page
+    """
+    ids, cursor = [], None
+    while True:
+        page = list(User.scan(order_by, cursor, limit))
+        ids += [user.id for user in page]
+        if len(page) < limit:
+            return ids
+        cursor = sort_key(page[-1], order_by)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("order_by", base.ORDER_KEYS)
+def test_pages_follow_the_order(monkeypatch, tmp_path, order_by, lazy):
+    """ Pages match a full sort, across saves and removes
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "deferred")
+    User.load_from_file()
+    for i in range(60):
+        User(email="u{}".format(i),
+             created_at="2024-01-01T00:00:{:02d}".format(i % 7)).save()
+    base.flush()
+    User.load_from_file(lazy=lazy)
+
+    def expected():
+        return [user.id for user in sorted(
+            User.all(), key=lambda user: sort_key(user, order_by))]
+
+    assert pages(order_by, 7) == expected()
+    for user in User.all()[::3]:
+        user.remove()
+    for user in User.all()[::4]:
+        user.first_name = "changed"
+        user.save()
+    User(email="new").save()
+    assert pages(order_by, 7) == expected()
+    assert list(User.scan(order_by, "~")) == []
+    base.flush()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+""" Round trip tests of the snapshot serializers
+"""
+import io
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.serializers import SERIALIZERS  # noqa: E402
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    """ A random JSON value, nested at most 3 levels deep
+    """
+    kind = rng.randrange(9 if depth < 3 else 7)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return rng.random() < 0.5
+    if kind == 2:
+        return rng.randint(-2 ** 80, 2 ** 80)
+    if kind == 3:
+        return rng.randint(-9, 9)
+    if kind == 4:
+        return rng.random() * 1e6
+    if kind in (5, 6):
+        return "".join(chr(rng.randrange(1, 0x3000))
+                       for _ in range(rng.randrange(6)))
+    if kind == 7:
+        return [random_value(rng, depth + 1) for _ in range(3)]
+    return {str(k): random_value(rng, depth + 1)
+            for k in range(rng.randrange(3))}
+
+
+def round_trip(serializer, objs_json: dict) -> dict:
+    """ Dump then load objs_json
+    """
+    f = io.BytesIO() if serializer.binary else io.StringIO()
+    serializer.dump(objs_json, f)
+    f.seek(0)
+    return dict(serializer.load(f))
+
+
+@pytest.mark.parametrize("name", sorted(SERIALIZERS))
+def test_random_objects_round_trip(name):
+    """ Any JSON values, and attributes missing from some objects
+    """
+    rng = random.Random(0)
+    for _ in range(10):
+        objs_json = {}
+        for i in range(rng.randrange(2000)):
+            keys = rng.sample("abcdefg", rng.randrange(7))
+            objs_json[str(i)] = dict({k: random_value(rng) for k in keys},
+                                     id=str(i))
+        assert round_trip(SERIALIZERS[name], objs_json) == objs_json
+
+
+def test_binary_rejects_truncated_and_unknown_files():
+    """ A cut file or another format is an error, not fewer objects
+    """
+    serializer = SERIALIZERS['binary']
+    f = io.BytesIO()
+    serializer.dump({"a": {"id": "a", "email": "a@b"}}, f)
+    for data in (f.getvalue()[:-1], b'{"a": {"id": "a"}}'):
+        with pytest.raises(ValueError):
+            list(serializer.load(io.BytesIO(data)))
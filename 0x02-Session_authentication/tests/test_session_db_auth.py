@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+""" Tests of SessionDBAuth logging a user out everywhere
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("flask")
+
+import models.base as base  # noqa: E402
+from api.v1.auth.session_db_auth import SessionDBAuth  # noqa: E402
+from models.user_session import UserSession  # noqa: E402
+
+
+def test_destroy_all_sessions_removes_stored_sessions(monkeypatch,
+                                                      tmp_path):
+    """ No session of the user stays valid, in memory or stored
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    monkeypatch.setenv("SESSION_DURATION", "60")
+    UserSession.load_from_file()
+    auth = SessionDBAuth()
+    mine = [auth.create_session("me") for _ in range(3)]
+    other = auth.create_session("other")
+    # Stored by another worker, unknown to this process' memory
+    UserSession(user_id="me", session_id="elsewhere").save()
+
+    assert auth.destroy_all_sessions("me") == 4
+    for session_id in mine + ["elsewhere"]:
+        assert auth.user_id_for_session_id(session_id) is None
+        assert session_id not in auth.user_id_by_session_id
+    assert auth.user_id_for_session_id(other) == "other"
+    assert [s.user_id for s in UserSession.all()] == ["other"]
+    assert auth.destroy_all_sessions("me") == 0
+    assert auth.destroy_all_sessions(None) == 0
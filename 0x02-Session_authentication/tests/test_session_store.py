@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Tests of the sharded session store bound."""
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.v1.auth.session_store import ShardedSessionStore  # noqa: E402
+
+
+def test_no_eviction_before_maxsize():
+    """Sessions are only dropped once maxsize are live in total."""
+    store = ShardedSessionStore(16, 64)
+    for n in range(64):
+        store['s{}'.format(n)] = 'u{}'.format(n)
+    assert len(store) == 64
+    assert store.stats()['evicted'] == 0
+    store['s64'] = 'u64'
+    assert len(store) == 64
+    assert store.stats()['evicted'] == 1
+    assert 's64' in store
+
+
+def test_new_session_alone_in_its_shard_is_kept():
+    """A full store evicts from another shard, never the new session."""
+    store = ShardedSessionStore(4, 2)
+    ids = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+    first = [i for i in ids if store.shard(i) == store.shard('a')][0]
+    other = [i for i in ids if store.shard(i) != store.shard(first)]
+    store[other[0]] = 'u'
+    store[other[1]] = 'u'
+    store[first] = 'v'
+    assert first in store
+    assert len(store) == 2
+    assert store.sessions_of('v') == [first]
+
+
+def test_size_follows_destroy():
+    """Replacing, popping and destroying keep the total exact."""
+    store = ShardedSessionStore(8, 10)
+    for n in range(10):
+        store['s{}'.format(n)] = 'u{}'.format(n % 2)
+    store['s0'] = 'u0'
+    assert len(store) == 10
+    assert store.pop('s1') == 'u1'
+    assert store.destroy_user('u0') == 5
+    assert len(store) == 4 == len(list(store))
+
+
+def test_concurrent_writers_respect_maxsize():
+    """Threads creating sessions never leave more than maxsize."""
+    store = ShardedSessionStore(16, 50)
+
+    def create(t):
+        for n in range(500):
+            store['{}-{}'.format(t, n)] = 'u{}'.format(t)
+
+    threads = [threading.Thread(target=create, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store) == 50 == len(list(store))
+    assert store.stats()['evicted'] == 8 * 500 - 50
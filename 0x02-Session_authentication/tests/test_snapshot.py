@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+""" Snapshot file tests: checksum footer, atomic and concurrent writes
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+@pytest.fixture
+def checksummed(monkeypatch, tmp_path):
+    """ Snapshot mode with checksums, one user saved in tmp_path
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    monkeypatch.setattr(base, "DB_FORMAT", "json")
+    monkeypatch.setattr(base, "CHECKSUM", True)
+    User.load_from_file()
+    User(email="a@b").save()
+    return tmp_path / ".db_User.json"
+
+
+def test_checksummed_snapshot_loads(checksummed):
+    """ A snapshot with a valid footer loads
+    """
+    User.load_from_file()
+    assert User.count() == 1
+
+
+@pytest.mark.parametrize("cut", [1, base.FOOTER_SIZE])
+def test_missing_footer_is_rejected(checksummed, cut):
+    """ A truncated footer, or none at all, fails the load
+    """
+    data = checksummed.read_bytes()
+    checksummed.write_bytes(data[:-cut])
+    with pytest.raises(ValueError):
+        User.load_from_file()
+
+
+def test_failed_write_leaves_no_temporary_file(checksummed, monkeypatch):
+    """ write_atomic removes its temporary file when the rename fails
+    """
+    def fail(src, dst):
+        raise OSError("rename failed")
+
+    monkeypatch.setattr(base.os, "replace", fail)
+    with pytest.raises(OSError):
+        User(email="c@d").save()
+    assert [p.name for p in checksummed.parent.iterdir()] == [
+        ".db_User.json"]
+
+
+def test_reads_dont_wait_for_writes(checksummed, monkeypatch):
+    """ A slow snapshot write doesn't hold the storage lock
+    """
+    write_atomic = base.write_atomic
+
+    def slow(file_path, data):
+        time.sleep(0.5)
+        write_atomic(file_path, data)
+
+    monkeypatch.setattr(base, "write_atomic", slow)
+    user = User.search({'email': "a@b"})[0]
+    writer = threading.Thread(target=User(email="c@d").save)
+    writer.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    assert User.get(user.id) is user
+    assert User.search({'email': "a@b"}) == [user]
+    assert time.perf_counter() - start < 0.3
+    writer.join()
+
+
+def test_concurrent_changes_end_up_on_disk(checksummed):
+    """ The last snapshot holds every change, lazily loaded or not
+    """
+    for i in range(50):
+        User(email="u{}".format(i)).save()
+    User.load_from_file(lazy=True)
+    errors = []
+
+    def change(t):
+        try:
+            for i in range(t, 50, 4):
+                user = User.search({'email': "u{}".format(i)})[0]
+                if i % 2:
+                    user.remove()
+                else:
+                    user.first_name = "f"
+                    user.save()
+                User(email="t{}-{}".format(t, i)).save()
+        except Exception as e:
+            errors.append(e)
+
+    def compact():
+        # Like Base.compact or flush, outside of any save
+        try:
+            while any(thread.is_alive() for thread in threads):
+                User.save_to_file()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=change, args=(t,)) for t in range(4)]
+    for thread in threads + [threading.Thread(target=compact)]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    expected = sorted((u.email, u.first_name) for u in User.all())
+    User.load_from_file()
+    assert sorted((u.email, u.first_name) for u in User.all()) == expected
+    assert User.count() == 1 + 25 + 50
+
+
+@pytest.mark.parametrize("old, new", [("json", "binary"),
+                                      ("binary", "json")])
+def test_format_migrates_both_ways(monkeypatch, tmp_path, old, new):
+    """ Switching DB_FORMAT back and forth keeps every object
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    monkeypatch.setattr(base, "CHECKSUM", False)
+    monkeypatch.setattr(base, "DB_FORMAT", old)
+    User.load_from_file()
+    for i in range(10):
+        User(email="u{}".format(i)).save()
+    for db_format in (new, old, new):
+        monkeypatch.setattr(base, "DB_FORMAT", db_format)
+        User.load_from_file()
+        assert User.count() == 10
+        User.load_from_file()
+        assert User.count() == 10
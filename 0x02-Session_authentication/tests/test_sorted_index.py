@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" Tests of the sorted indexes of Base
+"""
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.base import SortedIndex  # noqa: E402
+
+
+def incremental(pairs: list) -> SortedIndex:
+    """ An index filled one add_value at a time
+    """
+    index = SortedIndex('email')
+    for obj_id, value in pairs:
+        index.add_value(obj_id, value)
+    return index
+
+
+def test_build_matches_add_value():
+    """ A bulk build holds the same keys as single inserts
+    """
+    rng = random.Random(0)
+    pairs = [(str(i), rng.choice([None, "{}@x".format(rng.random())]))
+             for i in range(2000)]
+    index = SortedIndex('email')
+    index.build(pairs)
+    expected = incremental(pairs)
+    assert index.keys == expected.keys
+    assert index.values == expected.values
+    assert index.others == expected.others
+    index.add_value('new', '0@x')
+    index.discard('1')
+    expected.add_value('new', '0@x')
+    expected.discard('1')
+    assert index.keys == expected.keys
+
+
+def test_build_with_incomparable_values():
+    """ Values of another type go to others like with add_value
+    """
+    pairs = [('a', 'b@x'), ('b', 3), ('c', 'a@x'), ('d', None)]
+    index = SortedIndex('email')
+    index.build(pairs)
+    expected = incremental(pairs)
+    assert index.keys == expected.keys
+    assert index.others == expected.others
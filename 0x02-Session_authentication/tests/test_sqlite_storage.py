@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+""" SQLite backend tests: import of the file store and concurrent use
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+@pytest.mark.parametrize("db_format, checksum, persistence", [
+    ("json", False, "snapshot"),
+    ("json", True, "snapshot"),
+    ("binary", True, "snapshot"),
+    ("json", False, "log"),
+])
+def test_import_file_store(monkeypatch, tmp_path, db_format, checksum,
+                           persistence):
+    """ Switching to STORAGE=sqlite keeps every object of the file store
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "DB_FORMAT", db_format)
+    monkeypatch.setattr(base, "CHECKSUM", checksum)
+    monkeypatch.setattr(base, "PERSISTENCE", persistence)
+    monkeypatch.setattr(base, "COMPACT_THRESHOLD", 10 ** 6)
+    monkeypatch.setattr(base, "STORAGE", "memory")
+    monkeypatch.setattr(base, "STORES", {})
+    User.load_from_file()
+    users = [User(email="u{}@x".format(i)) for i in range(20)]
+    for user in users:
+        user.save()
+    users[0].remove()
+    users[1].first_name = "changed"
+    users[1].save()
+
+    monkeypatch.setattr(base, "STORAGE", "sqlite")
+    User.load_from_file()
+    assert User.count() == 19
+    assert User.get(users[0].id) is None
+    assert User.get(users[1].id).first_name == "changed"
+    assert sorted(u.email for u in User.all()) == \
+        sorted(u.email for u in users[1:])
+
+
+def test_import_runs_once(monkeypatch, tmp_path):
+    """ Objects removed from SQLite don't come back from the file store
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    monkeypatch.setattr(base, "STORAGE", "memory")
+    monkeypatch.setattr(base, "STORES", {})
+    User.load_from_file()
+    for i in range(10):
+        User(email="u{}@x".format(i)).save()
+
+    monkeypatch.setattr(base, "STORAGE", "sqlite")
+    User.load_from_file()
+    assert User.count() == 10
+    for user in User.all():
+        user.remove()
+    # A restart opens a new backend over the same database
+    monkeypatch.setattr(base, "STORES", {})
+    User.load_from_file()
+    assert User.count() == 0
+    User(email="new@x").save()
+    monkeypatch.setattr(base, "STORES", {})
+    User.load_from_file()
+    assert [u.email for u in User.all()] == ["new@x"]
+
+
+WORKER = """
+    import sys, threading
+    from models.user import User
+    from models.user_session import UserSession
+    User.load_from_file()
+    UserSession.load_from_file()
+    worker = sys.argv[1]
+    errors = []
+
+    def run(thread):
+        for i in range(50):
+            user = User(email="{}-{}-{}@x".format(worker, thread, i))
+            user.save()
+            user.first_name = "f"
+            user.save()
+            if i % 10 == 0:
+                user.remove()
+            # Every worker races for the same session ids
+            try:
+                UserSession(user_id=user.id,
+                            session_id="s{}".format(i)).save()
+            except ValueError:
+                pass
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert errors == [], errors
+"""
+
+
+def test_concurrent_processes_and_threads(tmp_path):
+    """ 4 processes of 4 threads share one database consistently
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, STORAGE="sqlite")
+    workers = [subprocess.Popen(
+        [sys.executable, "-c", textwrap.dedent(WORKER), str(w)],
+        cwd=str(tmp_path), env=env, stderr=subprocess.PIPE, text=True)
+        for w in range(4)]
+    for worker in workers:
+        assert worker.wait(timeout=120) == 0, worker.stderr.read()
+
+    check = subprocess.run([sys.executable, "-c", textwrap.dedent("""
+        from models.user import User
+        from models.user_session import UserSession
+        User.load_from_file()
+        UserSession.load_from_file()
+        users = User.all()
+        assert all(u.first_name == "f" for u in users)
+        ids = [s.session_id for s in UserSession.all()]
+        assert sorted(ids) == sorted(set(ids))
+        print(User.count(), len(users), len(ids))
+    """)], cwd=str(tmp_path), env=env, capture_output=True, text=True)
+    assert check.returncode == 0, check.stderr
+    # 4 workers * 4 threads * 50 users, minus 1 in 10 removed
+    assert check.stdout.split() == ["720", "720", "50"]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+""" Tests of GET /api/v1/users
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+flask = pytest.importorskip("flask")
+
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """ A test client of the users views over 30 stored Users
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base, "PERSISTENCE", "snapshot")
+    from api.v1.views import app_views
+    User.load_from_file()
+    for i in range(30):
+        User(email="{:02d}@x".format((i * 7) % 30)).save()
+    app = flask.Flask(__name__)
+    app.register_blueprint(app_views)
+    return app.test_client()
+
+
+def test_order_by_email_with_limit(client):
+    """ Ordering on a non-scan attribute goes through Base.query
+    """
+    res = client.get("/api/v1/users?order_by=email&limit=5")
+    assert res.status_code == 200
+    assert [u['email'] for u in res.get_json()] == \
+        ["{:02d}@x".format(i) for i in range(5)]
+
+
+def test_cursor_without_scan_order(client):
+    """ A cursor can't be combined with a search
+    """
+    res = client.get("/api/v1/users?order_by=email&cursor=00@x")
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+def test_pages_have_a_cursor(client, fmt):
+    """ Both formats can be paged through with X-Next-Cursor
+    """
+    emails, url = [], "/api/v1/users?order_by=created_at&limit=7"
+    while True:
+        res = client.get("{}&format={}".format(url, fmt))
+        assert res.status_code == 200
+        if fmt == "ndjson":
+            page = [flask.json.loads(line)
+                    for line in res.get_data(as_text=True).splitlines()]
+        else:
+            page = res.get_json()
+        emails += [user['email'] for user in page]
+        if 'X-Next-Cursor' not in res.headers:
+            break
+        url = "/api/v1/users?order_by=created_at&limit=7&cursor={}".format(
+            res.headers['X-Next-Cursor'])
+    assert sorted(emails) == ["{:02d}@x".format(i) for i in range(30)]
@@ -2,6 +2,9 @@
 
 """Module for hashing passwords for authentication"""
 
+import os
+import sys
+import time
 import bcrypt
 from sqlalchemy.orm.exc import NoResultFound
 from db import DB, User
@@ -17,11 +20,82 @@ def _hash_password(password: str) -> bytes:
     Returns:
         bytes: The salted hash of the password.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(_bcrypt_rounds())
     hashed = bcrypt.hashpw(password.encode(), salt)
     return hashed
 
 
+def _rounds_file() -> str:
+    """Returns the path of the file holding the calibrated cost factor.
+
+    Returns:
+        str: BCRYPT_ROUNDS_FILE, ~/.bcrypt_rounds if unset. The
+        personal data project reads and writes the same file.
+    """
+    return os.getenv("BCRYPT_ROUNDS_FILE",
+                     os.path.expanduser("~/.bcrypt_rounds"))
+
+
+def _bcrypt_rounds() -> int:
+    """Returns the configured bcrypt cost factor.
+
+    Returns:
+        int: The BCRYPT_ROUNDS environment variable if set, else the
+        cost saved by calibrate_rounds, else 12.
+    """
+    rounds = os.getenv("BCRYPT_ROUNDS")
+    if rounds is not None:
+        return int(rounds)
+    try:
+        with open(_rounds_file()) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 12
+
+
+def calibrate_rounds(target: float = 0.25, minimum: int = 4,
+                     maximum: int = 16) -> int:
+    """Picks the highest cost factor hashing within target seconds.
+
+    Args:
+        target (float): Latency budget of one hash, in seconds.
+        minimum (int): Lowest cost to try.
+        maximum (int): Highest cost to try.
+
+    Returns:
+        int: The cost, also saved to _rounds_file() for every process.
+    """
+    rounds = minimum
+    for cost in range(minimum, maximum + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+        if time.perf_counter() - start > target:
+            break
+        rounds = cost
+    path = _rounds_file()
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            f.write("{}\n".format(rounds))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rounds
+
+
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """Tells if a hash was made with a stale cost factor.
+
+    Args:
+        hashed_password (bytes): A $2b$NN$... bcrypt hash.
+
+    Returns:
+        bool: True if its cost differs from the configured one.
+    """
+    return int(hashed_password.split(b"$")[2]) != _bcrypt_rounds()
+
+
 def _generate_uuid() -> str:
     """Generates a UUID.
     """
@@ -63,14 +137,22 @@ class Auth:
             email (str): The email address of the user.
             password (str): The password of the user.
 
+        A valid password hashed with a stale cost factor is re-hashed
+        with the configured one.
+
         Returns:
             bool: True if the login is valid, False otherwise.
         """
         try:
             user = self._db.find_user_by(email=email)
-            return bcrypt.checkpw(password.encode(), user.hashed_password)
         except NoResultFound:
             return False
+        if not bcrypt.checkpw(password.encode(), user.hashed_password):
+            return False
+        if _needs_rehash(user.hashed_password):
+            self._db.update_user(
+                user.id, hashed_password=_hash_password(password))
+        return True
 
     def create_session(self, email: str) -> str:
         """Create a new session for a user
@@ -171,3 +253,9 @@ class Auth:
             hashed_password=new_password_hash,
             reset_token=None,
         )
+
+
+if __name__ == "__main__":
+    # python3 auth.py calibrate [target seconds]
+    if sys.argv[1:2] == ["calibrate"]:
+        print(calibrate_rounds(*map(float, sys.argv[2:3])))